@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire ``ttl`` seconds after being set."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires, value = item
+            if expires <= now:
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key, value) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class VersionedCache(TTLCache):
+    """TTLCache invalidated wholesale by bumping a version counter.
+
+    Readers capture ``version`` before querying and pass it to ``set``; a
+    result computed against data that changed in the meantime is dropped
+    instead of being cached.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize, ttl)
+        self.version = 0
+
+    def set(self, key, value, version=None) -> None:
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._store(key, value)
+
+    def discard(self, key) -> None:
+        """Drop one entry and fence off any in-flight fills."""
+        with self._lock:
+            self.version += 1
+            self._data.pop(key, None)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.version += 1
+            self._data.clear()
+
+    def stats(self) -> dict:
+        out = super().stats()
+        out["version"] = self.version
+        return out
@@ -0,0 +1,257 @@
+"""Expiry of abandoned carts.
+
+Carts are keyed by a client-generated id and only checkout ever clears one,
+so every visitor who adds an item and leaves would keep rows in ``carts`` and
+``cart_discounts`` forever. Each cart write stamps ``touched_at`` on all of
+the cart's rows (``touch``); ``CartSweeper`` deletes whole carts none of whose
+rows were touched for CART_TTL_DAYS, CART_SWEEP_BATCH carts per write so the
+write lock is only ever held briefly, then returns the freed pages to the
+filesystem with ``PRAGMA incremental_vacuum`` (PostgreSQL's autovacuum does
+that itself).
+
+SQLite files created before incremental auto-vacuum keep their free pages for
+reuse inside the file until converted once (rewrites the file; stop the app):
+    Run from backend/:  python -m app.carts --enable-incremental-vacuum
+A sweep can also be run by hand:  python -m app.carts [--ttl-days 30]
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from .db import connect, dialect
+from .metrics import Counter, registry
+from .migrations import migrate
+
+CART_TTL_DAYS = float(os.getenv("CART_TTL_DAYS", "30"))  # 0 disables the sweeper
+CART_SWEEP_INTERVAL = float(os.getenv("CART_SWEEP_INTERVAL", "3600"))
+CART_SWEEP_BATCH = int(os.getenv("CART_SWEEP_BATCH", "500"))
+# pause between batches so queued requests get the writer in between
+CART_SWEEP_PAUSE = float(os.getenv("CART_SWEEP_PAUSE", "0.05"))
+# pages handed back per sweep (4 KiB each by default)
+CART_VACUUM_PAGES = int(os.getenv("CART_VACUUM_PAGES", "2000"))
+
+_FMT = "%Y-%m-%d %H:%M:%S"
+# a cart's other rows are re-stamped at most this often, so a busy cart costs
+# one primary-key probe per write rather than a rewrite of every line
+_TOUCH_EVERY = min(timedelta(hours=1), timedelta(days=CART_TTL_DAYS) / 24) if CART_TTL_DAYS > 0 else timedelta(hours=1)
+
+_logger = logging.getLogger("app")
+
+rows_expired = Counter("shop_cart_rows_expired_total", "Abandoned cart rows deleted by the sweeper.", ("table",), registry)
+sweeps = Counter("shop_cart_sweeps_total", "Cart sweeps by outcome.", ("outcome",), registry)
+pages_vacuumed = Counter("shop_cart_vacuum_pages_total", "Free pages returned to the filesystem after sweeps.", (), registry)
+
+
+def now() -> str:
+    """The current UTC time as stored in ``touched_at``."""
+    return datetime.utcnow().strftime(_FMT)
+
+
+def touch(cur, cart_id: str, stamp: str) -> None:
+    """Re-stamp the cart's rows not stamped recently; call in the transaction
+    that writes the cart, after its own rows were written with ``stamp``."""
+    stale = (datetime.strptime(stamp, _FMT) - _TOUCH_EVERY).strftime(_FMT)
+    cur.execute("UPDATE carts SET touched_at = ? WHERE cart_id = ? AND touched_at < ?", (stamp, cart_id, stale))
+    cur.execute("UPDATE cart_discounts SET touched_at = ? WHERE cart_id = ? AND touched_at < ?", (stamp, cart_id, stale))
+
+
+# Carts expire whole: a row goes only once no line and no discount of its
+# cart has been touched since the cutoff, so a cart never loses its older lines
+# while a newer one is still fresh. The outer touched_at check makes a
+# concurrent touch win on PostgreSQL, where only the outer conditions are
+# rechecked against an updated row.
+_FRESH_LINE = "EXISTS (SELECT 1 FROM carts f WHERE f.cart_id = o.cart_id AND f.touched_at >= ?)"
+_FRESH_DISCOUNT = "EXISTS (SELECT 1 FROM cart_discounts f WHERE f.cart_id = o.cart_id AND f.touched_at >= ?)"
+_EXPIRE = {
+    "carts": "DELETE FROM carts WHERE touched_at < ? AND cart_id IN "
+             f"(SELECT DISTINCT cart_id FROM carts o WHERE touched_at < ? AND NOT {_FRESH_LINE} "
+             f"AND NOT {_FRESH_DISCOUNT} LIMIT ?)",
+    "cart_discounts": "DELETE FROM cart_discounts WHERE touched_at < ? AND cart_id IN "
+                      f"(SELECT cart_id FROM cart_discounts o WHERE touched_at < ? AND NOT {_FRESH_LINE} LIMIT ?)",
+}
+
+
+def expire_batch(conn, table: str, cutoff: str, limit: int) -> int:
+    """Delete the ``table`` rows of up to ``limit`` carts untouched since
+    ``cutoff``; returns the rows deleted."""
+    cur = conn.cursor()
+    sql = _EXPIRE[table]
+    # every placeholder but the LIMIT is the cutoff
+    cur.execute(sql, (cutoff,) * (sql.count("?") - 1) + (limit,))
+    n = cur.rowcount
+    conn.commit()
+    return n
+
+
+def incremental_vacuum(conn, pages: int) -> Optional[int]:
+    """Free up to ``pages`` pages; None when the file is not in incremental
+    auto-vacuum mode."""
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return None
+    before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    # the pragma frees one page per step and sqlite3 steps it only once
+    for _ in range(min(pages, before)):
+        conn.execute("PRAGMA incremental_vacuum(1)")
+    after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    conn.commit()
+    return before - after
+
+
+class CartSweeper:
+    """Background thread expiring abandoned carts every ``interval`` seconds.
+
+    ``run_write(fn, *args)`` runs ``fn(conn, *args)`` as one write and returns
+    its result (``AsyncDatabase.run_write``), so each batch queues behind
+    request writes instead of holding the lock across the whole sweep.
+    """
+
+    def __init__(self, run_write: Callable, dialect: str = "sqlite", ttl_days: float = CART_TTL_DAYS,
+                 interval: float = CART_SWEEP_INTERVAL, batch: int = CART_SWEEP_BATCH,
+                 pause: float = CART_SWEEP_PAUSE, vacuum_pages: int = CART_VACUUM_PAGES):
+        self.run_write = run_write
+        self.dialect = dialect
+        self.ttl_days = ttl_days
+        self.interval = interval
+        self.batch = batch
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+        self._stop = threading.Event()
+        self._thread = None
+        self._sweep_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._vacuum_warned = False
+        self.last_run = None
+        self.last_seconds = 0.0
+        self.last_rows = 0
+
+    def start(self) -> None:
+        if self.ttl_days <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cart-sweeper", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        # first sweep soon after startup, then every interval
+        delay = min(60.0, self.interval)
+        while not self._stop.wait(delay):
+            delay = self.interval
+            try:
+                self.sweep()
+            except Exception:
+                _logger.exception("cart sweep failed")
+
+    def sweep(self, ttl_days: Optional[float] = None) -> dict:
+        """Expire carts untouched for ``ttl_days`` (default the configured
+        TTL) and vacuum; returns what was reclaimed. One sweep at a time."""
+        ttl = self.ttl_days if ttl_days is None else ttl_days
+        cutoff = (datetime.utcnow() - timedelta(days=ttl)).strftime(_FMT)
+        with self._sweep_lock:
+            started = time.monotonic()
+            report = {"cutoff": cutoff, "carts": 0, "cart_discounts": 0, "pages_freed": None}
+            try:
+                for table in ("carts", "cart_discounts"):
+                    while not self._stop.is_set():
+                        n = self.run_write(expire_batch, table, cutoff, self.batch)
+                        report[table] += n
+                        rows_expired.inc(n, table=table)
+                        if n < self.batch:
+                            break
+                        time.sleep(self.pause)
+                if self.dialect == "sqlite" and (report["carts"] or report["cart_discounts"]):
+                    report["pages_freed"] = freed = self.run_write(incremental_vacuum, self.vacuum_pages)
+                    if freed is None and not self._vacuum_warned:
+                        self._vacuum_warned = True
+                        _logger.warning("database is not in incremental auto-vacuum mode; freed cart pages stay "
+                                        "in the file (convert once with python -m app.carts --enable-incremental-vacuum)")
+                    pages_vacuumed.inc(freed or 0)
+            except Exception:
+                sweeps.inc(outcome="error")
+                raise
+            sweeps.inc(outcome="ok")
+            with self._lock:
+                self.last_run = datetime.utcnow().strftime(_FMT)
+                self.last_seconds = time.monotonic() - started
+                self.last_rows = report["carts"] + report["cart_discounts"]
+            report["seconds"] = round(self.last_seconds, 3)
+        if report["carts"] or report["cart_discounts"]:
+            _logger.info(f"expired {report['carts']} cart rows and {report['cart_discounts']} cart discounts "
+                         f"untouched since {cutoff}")
+        return report
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "ttl_days": self.ttl_days,
+                "interval": self.interval,
+                "batch": self.batch,
+                "sweeps": sweeps.value(outcome="ok"),
+                "failed_sweeps": sweeps.value(outcome="error"),
+                "expired": {t: rows_expired.value(table=t) for t in ("carts", "cart_discounts")},
+                "pages_freed": pages_vacuumed.value(),
+                "last_run": self.last_run,
+                "last_seconds": round(self.last_seconds, 3),
+                "last_rows": self.last_rows,
+            }
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def enable_incremental_vacuum(url: str) -> int:
+    """Switch a SQLite file to incremental auto-vacuum; VACUUM rewrites the
+    whole file, so run it with the app stopped. Returns the pages freed."""
+    conn = connect(url, isolation_level=None)
+    try:
+        before = conn.execute("PRAGMA page_count").fetchone()[0]
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        return before - conn.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--ttl-days", type=float, default=CART_TTL_DAYS, help="expire carts untouched this long")
+    ap.add_argument("--enable-incremental-vacuum", action="store_true",
+                    help="convert a SQLite file to incremental auto-vacuum (VACUUMs the whole file) and exit")
+    args = ap.parse_args()
+    url = os.getenv("DATABASE_URL") or os.getenv("DB_PATH", "/data/shop.db")
+    if args.enable_incremental_vacuum:
+        if dialect(url) != "sqlite":
+            print("only SQLite files need converting; PostgreSQL's autovacuum reclaims space itself")
+            return 1
+        print(f"vacuumed; freed {enable_incremental_vacuum(url)} pages")
+        return 0
+    if args.ttl_days <= 0:
+        ap.error("--ttl-days must be positive")
+    conn = connect(url)
+    try:
+        migrate(conn)
+
+        def run_write(fn, *a):
+            try:
+                return fn(conn, *a)
+            except BaseException:
+                conn.rollback()
+                raise
+
+        report = CartSweeper(run_write, dialect(url), args.ttl_days, pause=0).sweep()
+    finally:
+        conn.close()
+    print(" ".join(f"{k}={v}" for k, v in report.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
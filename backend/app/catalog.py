@@ -0,0 +1,282 @@
+"""Bulk product import and export as CSV or JSON lines.
+
+Import reads the upload a row at a time, validates each row and upserts
+products by SKU in chunks of CATALOG_IMPORT_CHUNK rows, one write transaction
+and a few ``executemany`` calls per chunk. A bad row is reported by line
+number and skipped; the rest of its chunk is still written.
+
+Row fields: ``sku`` (required), ``name``, ``description``, ``price``,
+``stock`` and ``categories`` (category slugs, comma-separated in CSV, a list
+or a comma-separated string in JSON). A field left out (a missing CSV
+column, an absent JSON key) keeps the product's current value; new products
+need name and price. ``categories`` replaces the product's categories.
+``id`` and ``image_url`` are exported for reference and ignored on import;
+images are managed through the product endpoints, which keep media
+references counted. When several products share a SKU, the oldest is the
+one updated.
+
+Export walks products in id order, CATALOG_EXPORT_PAGE rows per query, and
+yields lines as it goes, so memory stays flat whatever the catalog size.
+It is not a snapshot: rows changed during the export may appear either way.
+"""
+import csv
+import io
+import json
+import math
+import os
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+CATALOG_IMPORT_CHUNK = int(os.getenv("CATALOG_IMPORT_CHUNK", "1000"))
+CATALOG_EXPORT_PAGE = int(os.getenv("CATALOG_EXPORT_PAGE", "1000"))
+# errors listed in an import report; the count covers all of them
+IMPORT_ERRORS_MAX = 1000
+
+FIELDS = ("sku", "name", "description", "price", "stock", "categories")
+READ_ONLY = ("id", "image_url")
+EXPORT_FIELDS = ("id", "sku", "name", "description", "price", "stock", "image_url", "categories")
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "jsonl": "application/x-ndjson"}
+
+
+class ImportFormatError(ValueError):
+    """The upload cannot be read as the given format at all."""
+
+
+class ImportRow(NamedTuple):
+    line: int
+    sku: str
+    # product columns present in the row
+    values: Dict[str, object]
+    # category ids; None leaves the product's categories alone
+    categories: Optional[List[int]]
+
+
+def guess_format(filename: Optional[str], content_type: Optional[str]) -> str:
+    name = (filename or "").lower()
+    if name.endswith((".jsonl", ".ndjson")) or "ndjson" in (content_type or "") or "jsonl" in (content_type or ""):
+        return "jsonl"
+    return "csv"
+
+
+def category_slugs(cur) -> Dict[str, int]:
+    cur.execute("SELECT slug, id FROM categories WHERE slug IS NOT NULL")
+    return dict(cur.fetchall())
+
+
+def read_records(stream, fmt: str) -> Iterator[Tuple[int, object]]:
+    """(line number, dict) per record of a binary stream, or (line number,
+    error message) for a record that cannot be parsed."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        header = reader.fieldnames or []
+        if "sku" not in header:
+            raise ImportFormatError("CSV header must include a sku column")
+        unknown = [h for h in header if h not in FIELDS and h not in READ_ONLY]
+        if unknown:
+            raise ImportFormatError(f"unknown CSV columns: {', '.join(unknown)}")
+        for rec in reader:
+            if None in rec:
+                yield reader.line_num, "more fields than the header"
+            elif None in rec.values():
+                yield reader.line_num, "fewer fields than the header"
+            else:
+                yield reader.line_num, rec
+        return
+    for n, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            yield n, "invalid JSON"
+            continue
+        yield n, rec if isinstance(rec, dict) else "expected a JSON object"
+
+
+def parse_row(line: int, rec: dict, slugs: Dict[str, int]) -> ImportRow:
+    """Validate one record; raises ValueError with the reason."""
+    unknown = [k for k in rec if k not in FIELDS and k not in READ_ONLY]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(map(str, unknown))}")
+    sku = str(rec.get("sku") or "").strip()
+    if not sku:
+        raise ValueError("sku is required")
+    values = {}
+    if "name" in rec:
+        values["name"] = str(rec["name"] or "").strip()
+        if not values["name"]:
+            raise ValueError("name is empty")
+    if "description" in rec:
+        values["description"] = "" if rec["description"] is None else str(rec["description"])
+    if "price" in rec:
+        try:
+            price = float(rec["price"])
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid price: {rec['price']!r}")
+        if not math.isfinite(price) or price < 0:
+            raise ValueError(f"invalid price: {rec['price']!r}")
+        values["price"] = price
+    if "stock" in rec:
+        raw = rec["stock"]
+        try:
+            stock = int(raw) if not isinstance(raw, float) or raw.is_integer() else None
+        except (TypeError, ValueError):
+            stock = None
+        if stock is None or stock < 0 or isinstance(raw, bool):
+            raise ValueError(f"invalid stock: {raw!r}")
+        values["stock"] = stock
+    categories = None
+    if "categories" in rec:
+        raw = rec["categories"]
+        names = raw.split(",") if isinstance(raw, str) else raw if isinstance(raw, list) else None
+        if names is None and raw is not None:
+            raise ValueError("categories must be a list or a comma-separated string")
+        names = list(dict.fromkeys(str(n).strip() for n in names or () if str(n).strip()))
+        missing = [n for n in names if n not in slugs]
+        if missing:
+            raise ValueError(f"unknown categories: {', '.join(missing)}")
+        categories = [slugs[n] for n in names]
+    return ImportRow(line, sku, values, categories)
+
+
+def _merge(a: ImportRow, b: ImportRow) -> ImportRow:
+    """The same SKU twice in one chunk: the later row wins field by field."""
+    return ImportRow(b.line, b.sku, {**a.values, **b.values}, b.categories if b.categories is not None else a.categories)
+
+
+def apply_chunk(conn, rows: List[ImportRow]) -> dict:
+    """Upsert one chunk of validated rows in the caller's transaction."""
+    cur = conn.cursor()
+    marks = ",".join("?" * len(rows))
+    cur.execute(f"SELECT sku, MIN(id) FROM products WHERE sku IN ({marks}) GROUP BY sku", [r.sku for r in rows])
+    ids = dict(cur.fetchall())
+    errors, inserts, updates, written = [], [], defaultdict(list), []
+    for r in rows:
+        pid = ids.get(r.sku)
+        if pid is None:
+            if "name" not in r.values or "price" not in r.values:
+                errors.append({"line": r.line, "sku": r.sku, "error": "new products need name and price"})
+                continue
+            inserts.append(r)
+        elif r.values:
+            cols = tuple(sorted(r.values))
+            updates[cols].append(tuple(r.values[c] for c in cols) + (pid,))
+        written.append(r)
+    if inserts:
+        cur.executemany(
+            "INSERT INTO products(sku, name, description, price, image_url, stock) VALUES (?,?,?,?,'',?)",
+            [(r.sku, r.values["name"], r.values.get("description", ""), r.values["price"], r.values.get("stock", 0))
+             for r in inserts],
+        )
+        cur.execute(f"SELECT sku, MIN(id) FROM products WHERE sku IN ({','.join('?' * len(inserts))}) GROUP BY sku",
+                    [r.sku for r in inserts])
+        ids.update(cur.fetchall())
+    for cols, params in updates.items():
+        cur.executemany(f"UPDATE products SET {', '.join(f'{c} = ?' for c in cols)} WHERE id = ?", params)
+    linked = [r for r in written if r.categories is not None]
+    if linked:
+        cur.executemany("DELETE FROM product_categories WHERE product_id = ?", [(ids[r.sku],) for r in linked])
+        cur.executemany(
+            "INSERT INTO product_categories(product_id, category_id) VALUES (?,?) ON CONFLICT DO NOTHING",
+            [(ids[r.sku], c) for r in linked for c in r.categories],
+        )
+    conn.commit()
+    return {"created": len(inserts), "updated": len(written) - len(inserts), "errors": errors}
+
+
+def import_products(stream, fmt: str, slugs: Dict[str, int], write: Callable[[List[ImportRow]], dict],
+                    chunk: int = CATALOG_IMPORT_CHUNK) -> dict:
+    """Read, validate and write ``stream`` chunk by chunk; ``write(rows)``
+    runs ``apply_chunk`` as one write. Raises ImportFormatError before
+    anything is written if the header is unusable; a later failure stops the
+    import with the chunks before it committed and says so in ``aborted``."""
+    report = {"rows": 0, "created": 0, "updated": 0, "failed": 0, "errors": [], "aborted": None}
+
+    def error(line: int, sku: Optional[str], message: str) -> None:
+        report["failed"] += 1
+        if len(report["errors"]) < IMPORT_ERRORS_MAX:
+            report["errors"].append({"line": line, "sku": sku, "error": message})
+
+    def flush(pending: Dict[str, ImportRow]) -> None:
+        result = write(list(pending.values()))
+        report["created"] += result["created"]
+        report["updated"] += result["updated"]
+        for e in result["errors"]:
+            error(e["line"], e["sku"], e["error"])
+        pending.clear()
+
+    pending: Dict[str, ImportRow] = {}
+    records = read_records(stream, fmt)
+    line = 0
+    try:
+        for line, rec in records:
+            report["rows"] += 1
+            if isinstance(rec, str):
+                error(line, None, rec)
+                continue
+            try:
+                row = parse_row(line, rec, slugs)
+            except ValueError as e:
+                error(line, str(rec.get("sku") or "") or None, str(e))
+                continue
+            prev = pending.get(row.sku)
+            pending[row.sku] = _merge(prev, row) if prev else row
+            if len(pending) >= chunk:
+                flush(pending)
+        if pending:
+            flush(pending)
+    except ImportFormatError:
+        raise
+    except (UnicodeDecodeError, csv.Error) as e:
+        report["aborted"] = f"unreadable input after line {line}: {e}"
+    except Exception as e:
+        report["aborted"] = f"write failed after line {line}: {e}"
+    # rows rejected in the write come back a chunk late
+    report["errors"].sort(key=lambda e: e["line"])
+    report["errors_truncated"] = report["failed"] > len(report["errors"])
+    return report
+
+
+def export_page(cur, after: int, limit: int = CATALOG_EXPORT_PAGE) -> List[dict]:
+    """Products with id > ``after`` in id order, categories as slugs."""
+    cur.execute(
+        "SELECT id, sku, name, description, price, stock, image_url FROM products WHERE id > ? ORDER BY id LIMIT ?",
+        (after, limit),
+    )
+    items = [dict(zip(EXPORT_FIELDS, r), categories=[]) for r in cur.fetchall()]
+    if items:
+        by_id = {it["id"]: it for it in items}
+        cur.execute(
+            "SELECT pc.product_id, c.slug FROM product_categories pc JOIN categories c ON c.id = pc.category_id "
+            f"WHERE pc.product_id IN ({','.join('?' * len(by_id))}) ORDER BY pc.product_id, c.slug",
+            list(by_id),
+        )
+        for pid, slug in cur.fetchall():
+            by_id[pid]["categories"].append(slug)
+    return items
+
+
+def export_lines(fetch_page: Callable[[int], List[dict]], fmt: str) -> Iterable[str]:
+    """Yield the export page by page; ``fetch_page(after_id)`` reads one."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if fmt == "csv":
+        writer.writerow(EXPORT_FIELDS)
+    after = 0
+    while True:
+        items = fetch_page(after)
+        if not items:
+            break
+        for it in items:
+            if fmt == "csv":
+                writer.writerow([",".join(it[f]) if f == "categories" else it[f] for f in EXPORT_FIELDS])
+            else:
+                buf.write(json.dumps(it, ensure_ascii=False) + "\n")
+        after = items[-1]["id"]
+        # one chunk per page keeps writes to the socket few and memory flat
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
@@ -0,0 +1,178 @@
+"""Coupon validation from an in-memory index, and redemption at checkout.
+
+``CouponIndex`` holds every coupon with its dates already parsed, so applying
+a code or pricing a cart costs no query. Admin coupon writes call
+``invalidate()``; other workers reload within COUPON_INDEX_TTL seconds.
+
+The index only answers "does this code apply now". Checkout calls ``redeem``
+in its own transaction: it re-reads the coupon row, re-prices the discount
+against the cart being ordered and counts the use with a guarded UPDATE, so
+global and per-user limits hold however many checkouts race for the last use.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, NamedTuple, Optional, Tuple
+
+COUPON_INDEX_TTL = float(os.getenv("COUPON_INDEX_TTL", "30"))
+
+COLUMNS = "id, code, type, value, active, valid_from, valid_to, min_amount, max_uses, max_uses_per_user, uses"
+
+_logger = logging.getLogger("app")
+
+
+class CouponError(ValueError):
+    """The coupon does not apply; the message says why."""
+
+
+class Coupon(NamedTuple):
+    id: int
+    code: str
+    type: str
+    value: float
+    active: bool
+    valid_from: Optional[datetime]
+    valid_to: Optional[datetime]
+    min_amount: float
+    # None means unlimited
+    max_uses: Optional[int]
+    max_uses_per_user: Optional[int]
+    uses: int
+
+
+def parse_when(value: Optional[str]) -> Optional[datetime]:
+    """A stored valid_from/valid_to (ISO 8601 date or time) as naive UTC."""
+    if not value:
+        return None
+    dt = datetime.fromisoformat(value.strip())
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def from_row(row) -> Coupon:
+    cid, code, type_, value, active, vfrom, vto, min_amount, max_uses, per_user, uses = row
+    try:
+        vfrom, vto = parse_when(vfrom), parse_when(vto)
+    except ValueError:
+        # written before dates were validated; never honoured
+        _logger.warning(f"coupon {code!r} has unreadable validity dates; treating it as inactive")
+        active, vfrom, vto = 0, None, None
+    return Coupon(cid, (code or "").strip(), type_, float(value or 0), bool(active), vfrom, vto,
+                  float(min_amount or 0), max_uses, per_user, uses or 0)
+
+
+def discount(coupon: Coupon, subtotal: float, now: datetime) -> float:
+    """The discount ``coupon`` gives on ``subtotal`` at ``now`` (naive UTC);
+    raises CouponError when it does not apply."""
+    if not coupon.active:
+        raise CouponError("coupon inactive")
+    if coupon.min_amount and subtotal < coupon.min_amount:
+        raise CouponError("minimum not met")
+    if coupon.valid_from and now < coupon.valid_from:
+        raise CouponError("not yet valid")
+    if coupon.valid_to and now > coupon.valid_to:
+        raise CouponError("expired")
+    if coupon.max_uses is not None and coupon.uses >= coupon.max_uses:
+        raise CouponError("usage limit reached")
+    if coupon.type == "percent":
+        return round(subtotal * coupon.value / 100.0, 2)
+    return min(subtotal, coupon.value)
+
+
+class CouponIndex:
+    """Every coupon by code, reloaded when invalidated or ``ttl`` old.
+
+    ``get(cur, code)`` reloads through the caller's cursor, so it works from
+    any thread or transaction without a connection of its own. ``uses`` is as
+    of the last load; only ``redeem`` enforces limits.
+    """
+
+    def __init__(self, ttl: float = COUPON_INDEX_TTL):
+        self.ttl = ttl
+        self._by_code: Dict[str, Coupon] = {}
+        self._loaded_at = None
+        self._version = 0
+        self._loaded_version = -1
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._version += 1
+
+    def _fresh(self) -> bool:
+        return self._loaded_version == self._version and time.monotonic() - self._loaded_at < self.ttl
+
+    def get(self, cur, code: str) -> Optional[Coupon]:
+        code = code.strip()
+        with self._lock:
+            if self._fresh():
+                self.hits += 1
+                return self._by_code.get(code)
+            version = self._version
+            self.misses += 1
+        cur.execute(f"SELECT {COLUMNS} FROM coupons ORDER BY id")
+        by_code = {}
+        for row in cur.fetchall():
+            c = from_row(row)
+            by_code.setdefault(c.code, c)
+        with self._lock:
+            # a write during the load bumped the version: serve it, reload next time
+            self._by_code = by_code
+            self._loaded_at = time.monotonic()
+            self._loaded_version = version
+            self.loads += 1
+        return by_code.get(code)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._by_code),
+                "ttl": self.ttl,
+                "loads": self.loads,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": 0,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "age": round(time.monotonic() - self._loaded_at, 3) if self._loaded_at is not None else None,
+            }
+
+
+def redeem(cur, code: str, subtotal: float, user_id: Optional[int], now: datetime) -> Tuple[int, float]:
+    """Re-validate ``code`` against its committed row and count one use;
+    returns (coupon id, discount). Run inside the checkout transaction, then
+    ``record_redemption`` once the order exists."""
+    cur.execute(f"SELECT {COLUMNS} FROM coupons WHERE code = ?", (code.strip(),))
+    row = cur.fetchone()
+    if row is None:
+        raise CouponError("invalid coupon")
+    coupon = from_row(row)
+    amount = discount(coupon, subtotal, now)
+    if coupon.max_uses_per_user is not None and user_id is None:
+        raise CouponError("sign in to use this coupon")
+    # Takes the coupon's row lock, so concurrent checkouts with this code queue
+    # here and each sees the uses and redemptions committed before it.
+    cur.execute(
+        "UPDATE coupons SET uses = uses + 1 WHERE id = ? AND active = 1 AND (max_uses IS NULL OR uses < max_uses)",
+        (coupon.id,),
+    )
+    if cur.rowcount == 0:
+        raise CouponError("usage limit reached")
+    if coupon.max_uses_per_user is not None:
+        cur.execute("SELECT COUNT(*) FROM coupon_redemptions WHERE coupon_id = ? AND user_id = ?", (coupon.id, user_id))
+        if cur.fetchone()[0] >= coupon.max_uses_per_user:
+            raise CouponError("usage limit reached for this account")
+    return coupon.id, amount
+
+
+def record_redemption(cur, coupon_id: int, order_id: int, user_id: Optional[int], amount: float) -> None:
+    cur.execute(
+        "INSERT INTO coupon_redemptions(coupon_id, order_id, user_id, discount) VALUES (?,?,?,?)",
+        (coupon_id, order_id, user_id, amount),
+    )
@@ -0,0 +1,554 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from .metrics import record_query
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "40"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "30"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256"))
+DB_ASYNC_READERS = int(os.getenv("DB_ASYNC_READERS", "4"))
+DB_ASYNC_QUEUE_MAX = int(os.getenv("DB_ASYNC_QUEUE_MAX", "1024"))
+# most write jobs folded into one group commit, and how long the writer may
+# wait for more jobs once it has one (0: only take what is already queued)
+DB_WRITE_BATCH_MAX = int(os.getenv("DB_WRITE_BATCH_MAX", "64"))
+DB_WRITE_BATCH_WAIT = float(os.getenv("DB_WRITE_BATCH_WAIT_MS", "0")) / 1000.0
+
+
+try:
+    import psycopg2
+except ImportError:  # only needed for DATABASE_URL=postgresql://...
+    psycopg2 = None
+
+# catch these rather than sqlite3's so handlers work on either backend
+DatabaseError = (sqlite3.Error, psycopg2.Error) if psycopg2 else (sqlite3.Error,)
+IntegrityError = (sqlite3.IntegrityError, psycopg2.IntegrityError) if psycopg2 else (sqlite3.IntegrityError,)
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+def dialect(url: str) -> str:
+    """"postgresql" for postgres:// and postgresql:// URLs, else "sqlite"."""
+    return "postgresql" if url.startswith(("postgres://", "postgresql://")) else "sqlite"
+
+
+def sqlite_path(url: str) -> str:
+    # sqlite:///relative.db and sqlite:////absolute.db; a bare path is a path
+    return url[len("sqlite:///"):] if url.startswith("sqlite:///") else url
+
+
+class _TimedCursor(sqlite3.Cursor):
+    """Reports every statement's execution time to the metrics."""
+
+    def execute(self, sql, params=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            record_query(time.perf_counter() - started)
+
+    def executemany(self, sql, seq):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq)
+        finally:
+            record_query(time.perf_counter() - started)
+
+
+class _TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+
+def connect(url: str, **kwargs):
+    """Open a connection to ``url`` (a DATABASE_URL or a SQLite file path).
+
+    ``isolation_level=None`` asks for autocommit mode on either backend.
+    """
+    if dialect(url) == "postgresql":
+        from .pg import connect as pg_connect
+
+        return pg_connect(url, autocommit=kwargs.get("isolation_level", "") is None)
+    conn = sqlite3.connect(
+        sqlite_path(url),
+        timeout=DB_BUSY_TIMEOUT,
+        check_same_thread=False,
+        cached_statements=DB_STATEMENT_CACHE,
+        factory=_TimedConnection,
+        **kwargs,
+    )
+    # only takes effect on a new file; see carts.py for converting old ones
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={int(DB_MMAP_SIZE)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+class ConnectionPool:
+    """Bounded pool of long-lived database connections.
+
+    FastAPI runs sync dependencies and the endpoint body on (possibly different)
+    threadpool workers, so a connection is leased for the whole request instead
+    of being pinned to a thread. The pool is sized to the worker count, which
+    keeps it at one open connection per busy worker thread; PRAGMAs and the
+    statement cache are configured once when a connection is opened.
+    """
+
+    def __init__(self, path: str, size: int = DB_POOL_SIZE, timeout: float = DB_POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        # LIFO keeps the most recently used (warm page/statement cache) connections busy
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._acquired = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+        self._timeouts = 0
+        self._discarded = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        return connect(self.path)
+
+    def acquire(self) -> sqlite3.Connection:
+        conn = None
+        create = False
+        with self._lock:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                if self._opened < self.size:
+                    self._opened += 1
+                    create = True
+        if create:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        elif conn is None:
+            started = time.monotonic()
+            try:
+                conn = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                with self._lock:
+                    self._waits += 1
+                    self._timeouts += 1
+                    self._wait_seconds += time.monotonic() - started
+                raise PoolExhausted(f"no database connection available after {self.timeout}s")
+            with self._lock:
+                self._waits += 1
+                self._wait_seconds += time.monotonic() - started
+        with self._lock:
+            self._acquired += 1
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except DatabaseError:
+            # broken connection: drop it so the slot can be reopened
+            with self._lock:
+                self._in_use -= 1
+                self._opened -= 1
+                self._discarded += 1
+            try:
+                conn.close()
+            except DatabaseError:
+                pass
+            return
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "opened": self._opened,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "peak_in_use": self._peak_in_use,
+                "acquired": self._acquired,
+                "waits": self._waits,
+                "wait_seconds": round(self._wait_seconds, 6),
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+            }
+
+    def close_all(self) -> None:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._opened -= 1
+            conn.close()
+
+
+@contextmanager
+def immediate(conn):
+    """BEGIN IMMEDIATE ... COMMIT around a block that must read and write
+    under the write lock. Inside a writer job the group transaction already
+    holds the lock, so only the job's savepoint is committed or rolled back.
+    """
+    if not isinstance(conn, _JobConnection):
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+class _JobConnection:
+    """The writer connection as seen by one job of a group commit.
+
+    The job runs inside ``SAVEPOINT job``; ``commit()`` keeps its work so far
+    (to be made durable by the group COMMIT) and ``rollback()`` undoes the
+    work since the last ``commit()``, so handler code written against a plain
+    connection behaves the same.
+    """
+
+    in_transaction = True
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def cursor(self):
+        return self._conn.cursor()
+
+    def execute(self, *args):
+        return self._conn.execute(*args)
+
+    def executemany(self, *args):
+        return self._conn.executemany(*args)
+
+    def commit(self) -> None:
+        self._conn.execute("RELEASE job")
+        self._conn.execute("SAVEPOINT job")
+
+    def rollback(self) -> None:
+        self._conn.execute("ROLLBACK TO job")
+
+
+class _Job:
+    __slots__ = ("fn", "args", "done", "cancelled", "queued_at", "context")
+
+    def __init__(self, fn, args, done, cancelled):
+        self.fn = fn
+        self.args = args
+        self.done = done
+        self.cancelled = cancelled
+        self.queued_at = time.monotonic()
+        # the submitting request's context, so its statements are tallied to it
+        self.context = contextvars.copy_context()
+
+
+def _future_job(fn, args) -> tuple:
+    """Job whose outcome resolves an asyncio future on the calling loop."""
+    loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+
+    def done(result, exc) -> None:
+        try:
+            loop.call_soon_threadsafe(_resolve, fut, result, exc)
+        except RuntimeError:
+            pass  # loop already closed
+
+    return _Job(fn, args, done, fut.cancelled), fut
+
+
+def _blocking_job(fn, args) -> tuple:
+    """Job whose outcome resolves a concurrent future a thread can wait on."""
+    fut = concurrent.futures.Future()
+
+    def done(result, exc) -> None:
+        if exc is not None:
+            fut.set_exception(exc)
+        else:
+            fut.set_result(result)
+
+    return _Job(fn, args, done, lambda: False), fut
+
+
+def _resolve(fut: asyncio.Future, result, exc) -> None:
+    if fut.cancelled():
+        return
+    if exc is not None:
+        fut.set_exception(exc)
+    else:
+        fut.set_result(result)
+
+
+class _Lane:
+    """A job queue served by ``threads`` threads that each own one connection."""
+
+    def __init__(self, name: str, path: str, threads: int, queue_max: int):
+        self.name = name
+        self.path = path
+        self.threads = threads
+        self.queue_max = queue_max
+        self._queue = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+        self.peak_queued = 0
+
+    def _ensure_started(self) -> None:
+        if not self._workers:
+            with self._lock:
+                if not self._workers:
+                    for i in range(self.threads):
+                        t = threading.Thread(target=self._run, name=f"db-{self.name}-{i}", daemon=True)
+                        t.start()
+                        self._workers.append(t)
+
+    def put(self, job: _Job) -> None:
+        self._ensure_started()
+        depth = self._queue.qsize()
+        if depth >= self.queue_max:
+            with self._lock:
+                self.rejected += 1
+            raise PoolExhausted(f"{self.name} queue is full")
+        with self._lock:
+            self.peak_queued = max(self.peak_queued, depth + 1)
+        self._queue.put(job)
+
+    def _connect(self) -> sqlite3.Connection:
+        return connect(self.path)
+
+    def _run(self) -> None:
+        conn = self._connect()
+        try:
+            while True:
+                job = self._queue.get()
+                if job is None:
+                    return
+                if job.cancelled():
+                    continue
+                started = time.monotonic()
+                result = exc = None
+                try:
+                    result = job.context.run(job.fn, conn, *job.args)
+                except BaseException as e:  # handed to the waiting caller
+                    exc = e
+                finally:
+                    if conn.in_transaction:
+                        conn.rollback()
+                self._account(time.monotonic() - started, 1 if exc is None else 0, 0 if exc is None else 1)
+                job.done(result, exc)
+        finally:
+            conn.close()
+
+    def _account(self, seconds: float, completed: int, failed: int) -> None:
+        with self._lock:
+            self.busy_seconds += seconds
+            self.completed += completed
+            self.failed += failed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "threads": self.threads,
+                "started": len(self._workers),
+                "queued": self._queue.qsize(),
+                "peak_queued": self.peak_queued,
+                "queue_max": self.queue_max,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "busy_seconds": round(self.busy_seconds, 6),
+            }
+
+    def stop(self, timeout: float = 10.0) -> None:
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._queue.put(None)
+        for t in workers:
+            t.join(timeout)
+
+
+class _WriterLane(_Lane):
+    """The single writer: folds queued jobs into one transaction (group commit).
+
+    Each job runs in its own savepoint, so a failing job is undone without
+    affecting the others, and every caller is answered only after the shared
+    COMMIT has succeeded. One fsync then covers the whole batch.
+    """
+
+    def __init__(self, path: str, queue_max: int, batch_max: int = DB_WRITE_BATCH_MAX,
+                 batch_wait: float = DB_WRITE_BATCH_WAIT):
+        super().__init__("writer", path, 1, queue_max)
+        self.batch_max = batch_max
+        self.batch_wait = batch_wait
+        self.commits = 0
+        self.commit_failures = 0
+        self.commit_seconds = 0.0
+        self.max_commit_seconds = 0.0
+        self.max_batch = 0
+        self.queue_wait_seconds = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        # autocommit mode: the writer issues BEGIN/SAVEPOINT/COMMIT itself
+        return connect(self.path, isolation_level=None)
+
+    def _batch(self, first: _Job) -> list:
+        jobs = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(jobs) < self.batch_max:
+            try:
+                remaining = deadline - time.monotonic()
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                self._queue.put(None)  # stop after this batch
+                break
+            jobs.append(job)
+        return [j for j in jobs if not j.cancelled()]
+
+    def _run(self) -> None:
+        conn = self._connect()
+        try:
+            while True:
+                first = self._queue.get()
+                if first is None:
+                    return
+                jobs = self._batch(first)
+                if jobs:
+                    self._run_batch(conn, jobs)
+        finally:
+            conn.close()
+
+    def _run_batch(self, conn: sqlite3.Connection, jobs: list) -> None:
+        started = time.monotonic()
+        wait = sum(started - j.queued_at for j in jobs)
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for job in jobs:
+                conn.execute("SAVEPOINT job")
+                try:
+                    outcomes.append((job.context.run(job.fn, _JobConnection(conn), *job.args), None))
+                except BaseException as e:
+                    conn.execute("ROLLBACK TO job")
+                    outcomes.append((None, e))
+                conn.execute("RELEASE job")
+            commit_started = time.monotonic()
+            conn.execute("COMMIT")
+            commit_seconds = time.monotonic() - commit_started
+        except BaseException as e:
+            # the batch is lost as a whole: every caller gets the error
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            with self._lock:
+                self.commit_failures += 1
+            self._account(time.monotonic() - started, 0, len(jobs))
+            for job in jobs:
+                job.done(None, e)
+            return
+        failed = sum(1 for _, exc in outcomes if exc is not None)
+        with self._lock:
+            self.commits += 1
+            self.commit_seconds += commit_seconds
+            self.max_commit_seconds = max(self.max_commit_seconds, commit_seconds)
+            self.max_batch = max(self.max_batch, len(jobs))
+            self.queue_wait_seconds += wait
+        self._account(time.monotonic() - started, len(jobs) - failed, failed)
+        for job, (result, exc) in zip(jobs, outcomes):
+            job.done(result, exc)
+
+    def stats(self) -> dict:
+        out = super().stats()
+        with self._lock:
+            jobs = self.completed + self.failed
+            out.update({
+                "commits": self.commits,
+                "commit_failures": self.commit_failures,
+                "avg_batch": round(jobs / self.commits, 3) if self.commits else 0.0,
+                "max_batch": self.max_batch,
+                "batch_max": self.batch_max,
+                "avg_commit_ms": round(self.commit_seconds / self.commits * 1000, 3) if self.commits else 0.0,
+                "max_commit_ms": round(self.max_commit_seconds * 1000, 3),
+                "avg_queue_wait_ms": round(self.queue_wait_seconds / jobs * 1000, 3) if jobs else 0.0,
+            })
+        return out
+
+
+class AsyncDatabase:
+    """Database access for handlers without holding a pooled connection.
+
+    ``fn(conn, *args)`` runs on a dedicated thread that owns its connection.
+    Reads fan out over ``readers`` threads on WAL snapshots. Every write goes
+    to the single writer, which group-commits whatever has queued up, so
+    writers never contend for the SQLite write lock. ``read``/``write`` are
+    awaited from coroutines; ``run_write`` blocks a sync handler's thread.
+    A transaction left open by a read is rolled back.
+    """
+
+    def __init__(self, path: str, readers: int = DB_ASYNC_READERS, queue_max: int = DB_ASYNC_QUEUE_MAX):
+        self.path = path
+        self._readers = _Lane("reader", path, readers, queue_max)
+        self._writer = _WriterLane(path, queue_max)
+
+    async def read(self, fn, *args):
+        job, fut = _future_job(fn, args)
+        self._readers.put(job)
+        return await fut
+
+    async def write(self, fn, *args):
+        job, fut = _future_job(fn, args)
+        self._writer.put(job)
+        return await fut
+
+    def run_write(self, fn, *args):
+        job, fut = _blocking_job(fn, args)
+        self._writer.put(job)
+        return fut.result()
+
+    def stats(self) -> dict:
+        return {"readers": self._readers.stats(), "writer": self._writer.stats()}
+
+    def close(self) -> None:
+        self._readers.stop()
+        self._writer.stop()
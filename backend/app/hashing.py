@@ -0,0 +1,128 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+PBKDF2_ROUNDS = int(os.getenv("PBKDF2_ROUNDS", "29000"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+HASH_QUEUE_MAX = int(os.getenv("HASH_QUEUE_MAX", str(HASH_WORKERS * 16)))
+
+
+def make_context(rounds: int = PBKDF2_ROUNDS) -> CryptContext:
+    # min_rounds makes needs_update() flag hashes made with a lower cost, so
+    # raising PBKDF2_ROUNDS upgrades users as they log in
+    return CryptContext(
+        schemes=["pbkdf2_sha256", "bcrypt"],
+        deprecated="auto",
+        pbkdf2_sha256__default_rounds=rounds,
+        pbkdf2_sha256__min_rounds=rounds,
+    )
+
+
+_worker_context = None
+
+
+def _context() -> CryptContext:
+    global _worker_context
+    if _worker_context is None:
+        _worker_context = make_context()
+    return _worker_context
+
+
+def _hash_job(password: str) -> str:
+    return _context().hash(password)
+
+
+def _verify_job(password: str, password_hash: str) -> bool:
+    return _context().verify(password, password_hash)
+
+
+class HashingBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    """Runs KDF work in a bounded process pool so it never occupies the event
+    loop or the request threadpool; callers await the result."""
+
+    def __init__(self, workers: int = HASH_WORKERS, queue_max: int = HASH_QUEUE_MAX):
+        self.workers = workers
+        self.queue_max = queue_max
+        self.context = make_context()
+        self._pool = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._peak_pending = 0
+        self._submitted = 0
+        self._completed = 0
+        self._rejected = 0
+        self._work_seconds = 0.0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    # spawn: forking a process that already runs threads is unsafe
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+        return self._pool
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.queue_max:
+                self._rejected += 1
+                raise HashingBusy("password hashing queue is full")
+            self._pending += 1
+            self._submitted += 1
+            self._peak_pending = max(self._peak_pending, self._pending)
+        started = time.monotonic()
+
+        def done(_fut):
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+                self._work_seconds += time.monotonic() - started
+
+        try:
+            fut = self._executor().submit(fn, *args)
+        except Exception:
+            done(None)
+            raise
+        fut.add_done_callback(done)
+        return fut
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(_hash_job, password))
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        return await asyncio.wrap_future(self._submit(_verify_job, password, password_hash))
+
+    def needs_update(self, password_hash: str) -> bool:
+        return self.context.needs_update(password_hash)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_max": self.queue_max,
+                "rounds": PBKDF2_ROUNDS,
+                "pending": self._pending,
+                "peak_pending": self._peak_pending,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "work_seconds": round(self._work_seconds, 6),
+                "avg_seconds": round(self._work_seconds / self._completed, 6) if self._completed else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
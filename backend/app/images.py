@@ -0,0 +1,151 @@
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List
+
+DERIVATIVE_WIDTHS = tuple(int(w) for w in os.getenv("IMAGE_DERIVATIVE_WIDTHS", "320,640,1280").split(",") if w.strip())
+DERIVATIVE_FORMATS = tuple(f.strip().lower() for f in os.getenv("IMAGE_DERIVATIVE_FORMATS", "webp,avif").split(",") if f.strip())
+DERIVATIVE_WORKERS = int(os.getenv("IMAGE_WORKERS", "1"))
+DERIVATIVE_SUBDIR = "d"
+# formats Pillow can decode reliably as a still image
+RASTER_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+
+_logger = logging.getLogger("app")
+
+_QUALITY = {"webp": 80, "avif": 55}
+
+
+def _supported_formats() -> List[str]:
+    from PIL import features
+
+    return [f for f in DERIVATIVE_FORMATS if features.check(f)]
+
+
+def render_derivatives(src_path: str, out_dir: str, widths=DERIVATIVE_WIDTHS) -> List[dict]:
+    """Write resized copies of ``src_path`` into ``out_dir``.
+
+    Widths larger than the original collapse to the original width. Files are
+    named by the hash of their bytes, so a name never changes meaning and can
+    be cached forever. Returns one dict per file: filename, width, format, size.
+    """
+    from PIL import Image, ImageOps
+
+    os.makedirs(out_dir, exist_ok=True)
+    out = []
+    with Image.open(src_path) as im:
+        im = ImageOps.exif_transpose(im)
+        if im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA" if "A" in im.getbands() else "RGB")
+        targets = sorted({min(w, im.width) for w in widths})
+        for width in targets:
+            height = max(1, round(im.height * width / im.width))
+            resized = im if width == im.width else im.resize((width, height), Image.LANCZOS)
+            for fmt in _supported_formats():
+                buf = io.BytesIO()
+                resized.save(buf, format=fmt.upper(), quality=_QUALITY.get(fmt, 80))
+                data = buf.getvalue()
+                fname = f"{hashlib.sha256(data).hexdigest()[:32]}.w{width}.{fmt}"
+                path = os.path.join(out_dir, fname)
+                if not os.path.exists(path):
+                    tmp = path + ".part"
+                    with open(tmp, "wb") as f:
+                        f.write(data)
+                    os.replace(tmp, path)
+                out.append({"filename": fname, "width": width, "format": fmt, "size": len(data)})
+    return out
+
+
+class DerivativeService:
+    """Renders derivatives in a process pool off the request path.
+
+    ``on_done(source_filename, derivatives)`` runs on completion so the caller
+    can record the files. It runs on a thread of its own, in completion order:
+    future callbacks run on the pool's result thread, which must not wait on
+    database writes while other renders finish or queue behind it.
+    """
+
+    def __init__(self, upload_dir: str, on_done: Callable[[str, List[dict]], None], workers: int = DERIVATIVE_WORKERS):
+        self.upload_dir = upload_dir
+        self.out_dir = os.path.join(upload_dir, DERIVATIVE_SUBDIR)
+        self.on_done = on_done
+        self.workers = workers
+        self._pool = None
+        self._results = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        try:
+            import PIL  # noqa: F401
+
+            self.enabled = bool(DERIVATIVE_WIDTHS and DERIVATIVE_FORMATS)
+        except ImportError:
+            _logger.warning("Pillow not installed; image derivatives disabled")
+            self.enabled = False
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                    self._thread = threading.Thread(target=self._run, name="image-derivatives", daemon=True)
+                    self._thread.start()
+        return self._pool
+
+    def submit(self, filename: str) -> bool:
+        if not self.enabled or os.path.splitext(filename)[1].lower() not in RASTER_EXTS:
+            return False
+        with self._lock:
+            self.submitted += 1
+        fut = self._executor().submit(render_derivatives, os.path.join(self.upload_dir, filename), self.out_dir)
+        fut.add_done_callback(lambda f: self._results.put((filename, f)))
+        return True
+
+    def _run(self) -> None:
+        while True:
+            item = self._results.get()
+            if item is None:
+                return
+            self._finish(*item)
+
+    def _finish(self, filename: str, fut) -> None:
+        try:
+            derivatives = fut.result()
+            self.on_done(filename, derivatives)
+            with self._lock:
+                self.completed += 1
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            _logger.exception(f"image derivatives failed for {filename}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "workers": self.workers,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "pending": self.submitted - self.completed - self.failed,
+            }
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+            thread, self._thread = self._thread, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        if thread is not None:
+            # results already in hand are recorded first
+            self._results.put(None)
+            thread.join(timeout)
@@ -0,0 +1,209 @@
+"""Keyset-paginated, filtered and sorted listings for the admin endpoints.
+
+A ``Listing`` describes one resource: the columns it returns, the sort keys
+and filters callers may use, and optional ``include`` loaders. ``page`` reads
+``limit`` rows after an opaque cursor, so every page costs the same however
+deep it is, and ties are always broken by id so the order is total.
+
+``sort`` takes comma-separated keys, each optionally prefixed with ``-``;
+mixed directions are paged with an expanded ``(a > ?) OR (a = ? AND b < ?)``
+predicate, uniform ones with a row-value comparison the index can seek on.
+Sort expressions must not be NULL (wrap nullable columns in COALESCE).
+"""
+import base64
+import json
+import re
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+LISTING_COUNT_CAP = 10000
+
+
+class InvalidQuery(ValueError):
+    """A sort key, filter value or cursor the listing does not accept."""
+
+
+class Filter(NamedTuple):
+    """A typed query filter: ``op`` is one of eq, in, min, max, since, until,
+    prefix, contains; ``type`` converts the raw value (int, float, bool, str,
+    timestamp)."""
+
+    expr: str
+    op: str = "eq"
+    type: Callable = str
+
+
+class Page(NamedTuple):
+    items: List[dict]
+    next_cursor: Optional[str]
+    # None unless asked for; ``exact`` False means a planner estimate or the cap
+    total: Optional[int] = None
+    exact: bool = True
+
+
+_LIKE_SPECIAL = re.compile(r"[\\%_]")
+_OPS = {"eq": "=", "min": ">=", "max": "<=", "since": ">=", "until": "<="}
+_TRUE = {"1", "true", "yes", "on"}
+_FALSE = {"0", "false", "no", "off"}
+
+
+def timestamp(value: str) -> str:
+    """ISO 8601 date or time as the stored 'YYYY-MM-DD HH:MM:SS' UTC text."""
+    dt = datetime.fromisoformat(value.strip())
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _convert(value: str, type_: Callable, name: str):
+    try:
+        if type_ is bool:
+            v = value.strip().lower()
+            if v not in _TRUE | _FALSE:
+                raise ValueError(value)
+            return 1 if v in _TRUE else 0
+        return type_(value)
+    except (TypeError, ValueError):
+        raise InvalidQuery(f"invalid value for {name}: {value!r}")
+
+
+def encode_cursor(keys: Sequence) -> str:
+    raw = json.dumps(list(keys), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, n: int) -> list:
+    try:
+        keys = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise InvalidQuery("invalid cursor")
+    if not isinstance(keys, list) or len(keys) != n:
+        raise InvalidQuery("invalid cursor")
+    return keys
+
+
+class Listing:
+    """One admin resource.
+
+    ``columns`` maps output field -> SQL expression over ``source``;
+    ``sorts`` maps sort key -> SQL expression; ``where`` is a fixed condition
+    (e.g. originals only); ``includes`` maps a name to ``fn(cur, items)``
+    that adds related rows to the whole page at once.
+    """
+
+    def __init__(self, source: str, columns: Dict[str, str], sorts: Dict[str, str], filters: Dict[str, Filter],
+                 default_sort: str = "-id", id_expr: str = "id", where: Sequence[str] = (),
+                 includes: Optional[Dict[str, Callable]] = None):
+        self.source = source
+        self.columns = columns
+        self.sorts = sorts
+        self.filters = filters
+        self.default_sort = default_sort
+        self.id_expr = id_expr
+        self.where = list(where)
+        self.includes = includes or {}
+
+    def _order(self, sort: Optional[str]) -> List[Tuple[str, bool]]:
+        keys = []
+        for part in (sort or self.default_sort).split(","):
+            part = part.strip()
+            desc = part.startswith("-")
+            name = part[1:] if desc else part
+            if name not in self.sorts:
+                raise InvalidQuery(f"invalid sort: {part!r} (allowed: {', '.join(sorted(self.sorts))})")
+            keys.append((self.sorts[name], desc))
+        if not any(expr == self.id_expr for expr, _ in keys):
+            keys.append((self.id_expr, keys[-1][1] if keys else True))
+        return keys
+
+    def _filters(self, values: Dict[str, Optional[str]]) -> Tuple[List[str], list]:
+        where, params = list(self.where), []
+        for name, raw in values.items():
+            if raw is None or raw == "":
+                continue
+            f = self.filters.get(name)
+            if f is None:
+                raise InvalidQuery(f"unknown filter: {name}")
+            if f.op == "in":
+                vals = [_convert(v, f.type, name) for v in str(raw).split(",") if v.strip()]
+                where.append(f"{f.expr} IN ({','.join('?' * len(vals))})")
+                params.extend(vals)
+            elif f.op == "prefix":
+                # a range instead of LIKE 'x%' so the column's index is used
+                where.append(f"{f.expr} >= ? AND {f.expr} < ?")
+                params.extend([str(raw), str(raw) + "\U0010ffff"])
+            elif f.op == "contains":
+                # ASCII case-insensitive on both backends, like SQLite's LIKE
+                where.append(f"LOWER({f.expr}) LIKE LOWER(?) ESCAPE '\\'")
+                params.append("%" + _LIKE_SPECIAL.sub(r"\\\g<0>", str(raw)) + "%")
+            else:
+                where.append(f"{f.expr} {_OPS[f.op]} ?")
+                params.append(_convert(str(raw), f.type, name))
+        return where, params
+
+    @staticmethod
+    def _after(order: List[Tuple[str, bool]], keys: list) -> Tuple[str, list]:
+        """Predicate selecting rows that sort after ``keys``."""
+        if len({desc for _, desc in order}) == 1:
+            cols = ", ".join(expr for expr, _ in order)
+            return f"({cols}) {'<' if order[0][1] else '>'} ({','.join('?' * len(order))})", list(keys)
+        terms, params = [], []
+        for i, (expr, desc) in enumerate(order):
+            eqs = [f"{e} = ?" for e, _ in order[:i]]
+            terms.append("(" + " AND ".join(eqs + [f"{expr} {'<' if desc else '>'} ?"]) + ")")
+            params.extend(keys[: i + 1])
+        return "(" + " OR ".join(terms) + ")", params
+
+    def page(self, cur, filters: Dict[str, Optional[str]], sort: Optional[str] = None, limit: int = 100,
+             cursor: Optional[str] = None, count: bool = False, include: Optional[str] = None,
+             dialect: str = "sqlite") -> Page:
+        order = self._order(sort)
+        where, params = self._filters(filters)
+        wanted = [i.strip() for i in (include or "").split(",") if i.strip()]
+        bad = [i for i in wanted if i not in self.includes]
+        if bad:
+            raise InvalidQuery(f"unknown include: {', '.join(bad)}")
+        total, exact = (self._count(cur, where, params, dialect) if count else (None, True))
+
+        names = list(self.columns)
+        select = ", ".join(f"{expr} AS {name}" for name, expr in self.columns.items())
+        select += "".join(f", {expr} AS _k{i}" for i, (expr, _) in enumerate(order))
+        sql_where, args = list(where), list(params)
+        if cursor:
+            pred, pred_args = self._after(order, decode_cursor(cursor, len(order)))
+            sql_where.append(pred)
+            args.extend(pred_args)
+        sql = f"SELECT {select} FROM {self.source}"
+        if sql_where:
+            sql += " WHERE " + " AND ".join(sql_where)
+        sql += " ORDER BY " + ", ".join(f"{expr} {'DESC' if desc else 'ASC'}" for expr, desc in order)
+        # one extra row tells us whether another page exists
+        sql += " LIMIT ?"
+        args.append(limit + 1)
+        cur.execute(sql, tuple(args))
+        rows = cur.fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][len(names):])
+        items = [dict(zip(names, r)) for r in rows]
+        for name in wanted:
+            if items:
+                self.includes[name](cur, items)
+        return Page(items, next_cursor, total, exact)
+
+    def _count(self, cur, where: List[str], params: list, dialect: str) -> Tuple[int, bool]:
+        """Exact up to LISTING_COUNT_CAP rows; past that, PostgreSQL's planner
+        estimate, or the cap as a lower bound on SQLite."""
+        sql = f"SELECT 1 FROM {self.source}" + (" WHERE " + " AND ".join(where) if where else "")
+        cur.execute(f"SELECT COUNT(*) FROM ({sql} LIMIT ?) AS capped", tuple(params) + (LISTING_COUNT_CAP + 1,))
+        n = cur.fetchone()[0]
+        if n <= LISTING_COUNT_CAP:
+            return n, True
+        if dialect == "postgresql":
+            cur.execute(f"EXPLAIN (FORMAT JSON) {sql}", tuple(params))
+            plan = cur.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return max(int(plan[0]["Plan"]["Plan Rows"]), LISTING_COUNT_CAP), False
+        return LISTING_COUNT_CAP, False
@@ -0,0 +1,455 @@
+"""Application and access logging off the request path.
+
+Records go through a bounded in-memory queue (``QueueHandler``) to a single
+``QueueListener`` thread that formats them as JSON lines and writes the
+rotating log file, so a slow disk never stalls the event loop; when the queue
+is full records are dropped and counted rather than blocking.
+
+The access log is one line per request with the route template (not the raw
+path, so ``/products/{pid}`` aggregates), status, latency, authenticated
+user id and response bytes. Successful responses on hot routes can be
+sampled (ACCESS_LOG_SAMPLE); sampled lines carry ``sample_rate`` so counts
+can be scaled back up. Errors and slow requests are always logged.
+
+Reading goes the other way: ``tail`` seeks backwards through the live file and
+then the rotated ones in blocks, so the last N matching lines cost about N
+lines of I/O however large the files are, and ``follow`` streams lines as they
+are appended, surviving rotation.
+"""
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+import anyio
+import anyio.to_thread
+
+# "size": rotate at LOG_MAX_BYTES; "time": rotate every LOG_ROTATE_INTERVAL
+# LOG_ROTATE_WHEN (TimedRotatingFileHandler units, e.g. midnight, H)
+LOG_ROTATE = os.getenv("LOG_ROTATE", "size")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "10"))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")
+LOG_ROTATE_INTERVAL = int(os.getenv("LOG_ROTATE_INTERVAL", "1"))
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# route template=rate for 2xx/304 responses, e.g. "/products=0.05,/cart=0.1"
+ACCESS_LOG_SAMPLE = os.getenv("ACCESS_LOG_SAMPLE", "/products=0.1,/products/{pid}=0.1,/cart=0.1,/health=0.01")
+ACCESS_LOG_SLOW_MS = float(os.getenv("ACCESS_LOG_SLOW_MS", "1000"))
+LOG_TAIL_BLOCK = 64 * 1024
+LOG_FOLLOW_POLL = float(os.getenv("LOG_FOLLOW_POLL", "0.5"))
+LOG_FOLLOW_HEARTBEAT = 15.0
+
+# request fields a JSON line may carry besides the message
+ACCESS_FIELDS = ("method", "path", "route", "status", "latency_ms", "user_id", "bytes", "client", "sample_rate")
+
+access_logger = logging.getLogger("app.access")
+
+# per-request dict the auth dependency fills in; mutated in place so a value
+# set on a threadpool worker is still visible to the middleware
+request_context: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("request_context", default=None)
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for part in spec.split(","):
+        route, _, rate = part.strip().rpartition("=")
+        if route:
+            rates[route] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+def route_template(scope) -> str:
+    """The matched route's path template, e.g. ``/products/{pid}``."""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # mounted apps (static files) have no route object
+    root = scope.get("root_path", "")
+    return f"{root}/{{path}}" if root else "<unmatched>"
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts (UTC, ms), level, logger, msg, any
+    request fields present on the record, and exc for tracebacks."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.")
+            + f"{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in ACCESS_FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                out[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Never blocks: a full queue drops the record and counts it."""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # resolve the message and traceback here (the arguments may change
+        # before the listener runs) but keep them apart for the JSON fields
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _file_handler(path: str) -> logging.Handler:
+    if LOG_ROTATE == "time":
+        return logging.handlers.TimedRotatingFileHandler(
+            path, when=LOG_ROTATE_WHEN, interval=LOG_ROTATE_INTERVAL, backupCount=LOG_BACKUPS, encoding="utf-8", utc=True
+        )
+    return logging.handlers.RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8")
+
+
+class LogPipeline:
+    """Owns the queue handler on the ``app`` logger and its listener thread."""
+
+    def __init__(self, path: str, logger: logging.Logger, queue_max: int = LOG_QUEUE_MAX):
+        self.path = path
+        self.logger = logger
+        self.file_handler = _file_handler(path)
+        self.file_handler.setFormatter(JsonFormatter())
+        self.queue = queue.Queue(queue_max)
+        self.handler = _QueueHandler(self.queue)
+        self.listener = logging.handlers.QueueListener(self.queue, self.file_handler, respect_handler_level=True)
+        self._lock = threading.Lock()
+        self._started = False
+        logger.setLevel(LOG_LEVEL)
+        logger.addHandler(self.handler)
+
+    def start(self) -> None:
+        with self._lock:
+            if not self._started:
+                self.listener.start()
+                self._started = True
+
+    def stop(self) -> None:
+        """Flush what is queued and stop the listener thread."""
+        with self._lock:
+            if self._started:
+                self.listener.stop()
+                self._started = False
+        self.file_handler.flush()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "queue_max": self.queue.maxsize,
+            "dropped": self.handler.dropped,
+            "rotate": LOG_ROTATE,
+        }
+
+
+class AccessLogMiddleware:
+    """ASGI middleware writing the access log line once the response is sent.
+
+    Unhandled exceptions are logged with their traceback and answered with a
+    500 if the response has not started yet.
+    """
+
+    def __init__(self, app, logger: logging.Logger = access_logger, sample: Optional[Dict[str, float]] = None,
+                 slow_ms: float = ACCESS_LOG_SLOW_MS):
+        self.app = app
+        self.logger = logger
+        self.sample = parse_sample_rates(ACCESS_LOG_SAMPLE) if sample is None else sample
+        self.slow_ms = slow_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        state = {"status": 500, "bytes": 0, "started": False}
+        ctx = {}
+        token = request_context.set(ctx)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                state["started"] = True
+            elif message["type"] == "http.response.body":
+                state["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        exc_info = None
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            exc_info = e
+            if not state["started"]:
+                body = b'{"detail":"internal server error"}'
+                await send_wrapper({
+                    "type": "http.response.start",
+                    "status": 500,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+                })
+                await send_wrapper({"type": "http.response.body", "body": body})
+        finally:
+            request_context.reset(token)
+            self._log(scope, state, ctx, (time.perf_counter() - started) * 1000, exc_info)
+
+    def _log(self, scope, state: dict, ctx: dict, latency_ms: float, exc: Optional[BaseException]) -> None:
+        route = route_template(scope)
+        status = state["status"]
+        rate = None
+        if exc is None and (200 <= status < 300 or status == 304) and latency_ms < self.slow_ms:
+            rate = self.sample.get(route)
+            if rate is not None:
+                if rate < 1.0 and random.random() >= rate:
+                    return
+                if rate >= 1.0:
+                    rate = None
+        client = scope.get("client")
+        fields = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": route,
+            "status": status,
+            "latency_ms": round(latency_ms, 2),
+            "user_id": ctx.get("user_id"),
+            "bytes": state["bytes"],
+            "client": client[0] if client else None,
+            "sample_rate": rate,
+        }
+        msg = f"{fields['method']} {route} -> {status}"
+        if exc is not None:
+            self.logger.error(f"Unhandled error on {scope['method']} {scope['path']}: {exc}", exc_info=exc, extra=fields)
+        elif status >= 500:
+            self.logger.error(msg, extra=fields)
+        elif status >= 400 or latency_ms >= self.slow_ms:
+            self.logger.warning(msg, extra=fields)
+        else:
+            self.logger.info(msg, extra=fields)
+
+
+def parse_ts(value: str) -> str:
+    """ISO 8601 time (naive means UTC) in the ``ts`` format, so log times
+    compare as strings. Raises ValueError."""
+    dt = datetime.fromisoformat(value.strip().replace(" ", "T"))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}Z"
+
+
+def _line_ts(line: str) -> Optional[str]:
+    # JsonFormatter always writes ts first: {"ts": "2024-01-01T00:00:00.000Z", ...
+    if line.startswith('{"ts": "'):
+        return line[8:32]
+    return None
+
+
+class LogFilter:
+    """Which lines ``tail``/``follow`` return.
+
+    ``level`` keeps that level and above, ``path`` matches a request path
+    prefix or a route template, ``since``/``until`` bound ``ts`` (inclusive,
+    in ``parse_ts`` form). Lines that are not JSON only pass an empty filter.
+    """
+
+    def __init__(self, level: Optional[str] = None, path: Optional[str] = None,
+                 since: Optional[str] = None, until: Optional[str] = None):
+        self.min_level = logging.getLevelName(level.upper()) if level else None
+        if self.min_level is not None and not isinstance(self.min_level, int):
+            raise ValueError(f"unknown level {level!r}")
+        self.path = path
+        self.since = since
+        self.until = until
+
+    @property
+    def empty(self) -> bool:
+        return self.min_level is None and not self.path and not self.since and not self.until
+
+    def match(self, line: str) -> bool:
+        if self.empty:
+            return True
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return False
+        if not isinstance(entry, dict):
+            return False
+        if self.min_level is not None:
+            level = logging.getLevelName(entry.get("level", ""))
+            if not isinstance(level, int) or level < self.min_level:
+                return False
+        if self.path and not (str(entry.get("path", "")).startswith(self.path) or entry.get("route") == self.path):
+            return False
+        ts = entry.get("ts", "")
+        if (self.since and ts < self.since) or (self.until and ts > self.until):
+            return False
+        return True
+
+
+def log_files(path: str) -> List[str]:
+    """The live log and its rotated files (``app.log.1`` or
+    ``app.log.2024-01-01``), newest first."""
+    directory, base = os.path.split(path)
+    rotated = []
+    try:
+        names = os.listdir(directory or ".")
+    except OSError:
+        return []
+    for name in names:
+        if name.startswith(base + "."):
+            full = os.path.join(directory, name)
+            try:
+                rotated.append((os.path.getmtime(full), full))
+            except OSError:
+                continue
+    rotated.sort(reverse=True)
+    files = [p for _, p in rotated]
+    return ([path] if os.path.exists(path) else []) + files
+
+
+def reverse_lines(path: str, block: int = LOG_TAIL_BLOCK) -> Iterator[str]:
+    """Lines of ``path`` from the last to the first, reading ``block`` bytes
+    at a time from the end."""
+    with open(path, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        rest = b""
+        while pos > 0:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            lines = (f.read(step) + rest).split(b"\n")
+            # the first piece may continue in the previous block
+            rest = lines.pop(0)
+            for line in reversed(lines):
+                if line:
+                    yield line.decode("utf-8", errors="replace")
+        if rest:
+            yield rest.decode("utf-8", errors="replace")
+
+
+def tail(path: str, limit: int, flt: Optional[LogFilter] = None) -> List[str]:
+    """The last ``limit`` lines matching ``flt`` across the live and rotated
+    files, oldest first. Stops at the first file or line older than
+    ``flt.since``."""
+    flt = flt or LogFilter()
+    since_epoch = None
+    if flt.since:
+        since_epoch = datetime.strptime(flt.since, "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc).timestamp()
+    out = []
+    for fpath in log_files(path):
+        try:
+            # last written before the window: this file and older ones are out
+            if since_epoch is not None and os.path.getmtime(fpath) < since_epoch:
+                break
+            for line in reverse_lines(fpath):
+                ts = _line_ts(line)
+                if ts is not None:
+                    if flt.until and ts > flt.until:
+                        continue
+                    if flt.since and ts < flt.since:
+                        out.reverse()
+                        return out
+                if flt.match(line):
+                    out.append(line)
+                    if len(out) >= limit:
+                        out.reverse()
+                        return out
+        except FileNotFoundError:
+            continue  # rotated away while we were reading
+    out.reverse()
+    return out
+
+
+class _Follower:
+    """Reads what is appended to a log file, reopening it after rotation."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.f = None
+        self.inode = None
+        self.partial = b""
+        self._open(at_end=True)
+
+    def _open(self, at_end: bool) -> None:
+        try:
+            self.f = open(self.path, "rb")
+        except FileNotFoundError:
+            self.f = None
+            return
+        if at_end:
+            self.f.seek(0, os.SEEK_END)
+        self.inode = os.fstat(self.f.fileno()).st_ino
+
+    def read(self) -> List[str]:
+        if self.f is None:
+            self._open(at_end=False)
+            if self.f is None:
+                return []
+        data = self.f.read()
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        if st is None or st.st_ino != self.inode or st.st_size < self.f.tell():
+            # rotated or truncated: finish the old file, then start the new one
+            data += self.f.read()
+            self.f.close()
+            self._open(at_end=False)
+            if self.f is not None:
+                data += self.f.read()
+        *lines, self.partial = (self.partial + data).split(b"\n")
+        return [ln.decode("utf-8", errors="replace") for ln in lines if ln]
+
+    def close(self) -> None:
+        if self.f is not None:
+            self.f.close()
+
+
+async def follow(path: str, flt: Optional[LogFilter] = None, poll: float = LOG_FOLLOW_POLL,
+                 heartbeat: float = LOG_FOLLOW_HEARTBEAT) -> AsyncIterator[Optional[str]]:
+    """Yield matching lines as they are written to ``path``, and None after
+    ``heartbeat`` seconds without one so the caller can keep the stream alive.
+    Files are read on a worker thread."""
+    flt = flt or LogFilter()
+    follower = await anyio.to_thread.run_sync(_Follower, path)
+    quiet = 0.0
+    try:
+        while True:
+            lines = [ln for ln in await anyio.to_thread.run_sync(follower.read) if flt.match(ln)]
+            for line in lines:
+                yield line
+            if lines:
+                quiet = 0.0
+            else:
+                quiet += poll
+                if quiet >= heartbeat:
+                    quiet = 0.0
+                    yield None
+            await anyio.sleep(poll)
+    finally:
+        follower.close()
@@ -0,0 +1,143 @@
+"""One-time compaction of UPLOAD_DIR into content-addressed names.
+
+Files saved before content addressing have random names, so identical images
+may be stored many times. This renames every top-level file to
+``<sha256><ext>``, removes the duplicates, repoints products and media rows
+at the surviving name, merges duplicate media rows (summing their refs) and
+registers product images that never had a media row. Files that already
+carry their content hash are left alone, so running it again is a no-op.
+
+Only local files and URLs are rewritten; objects already copied to blob
+storage keep their old names.
+
+Run from backend/:  python -m app.media_compact [--dry-run]
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+from .db import connect
+from .migrations import migrate
+from .uploads import file_sha256
+
+_HASHED = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _url_for(fname: str, image_base: str) -> str:
+    return f"{image_base.rstrip('/')}/images/{fname}" if image_base else f"/images/{fname}"
+
+
+def _scan(upload_dir: str) -> Dict[str, List[str]]:
+    """Map content-addressed target name -> legacy file names with those bytes."""
+    groups = defaultdict(list)
+    for name in sorted(os.listdir(upload_dir)):
+        path = os.path.join(upload_dir, name)
+        if name.startswith(".") or not os.path.isfile(path):
+            continue
+        stem, ext = os.path.splitext(name)
+        if _HASHED.match(stem):
+            continue
+        groups[f"{file_sha256(path)}{ext.lower()}"].append(name)
+    return groups
+
+
+def compact(conn: sqlite3.Connection, upload_dir: str, image_base: str = "", dry_run: bool = False) -> dict:
+    groups = _scan(upload_dir)
+    report = {"legacy_files": sum(len(v) for v in groups.values()), "unique": len(groups),
+              "removed": 0, "bytes_reclaimed": 0, "products_repointed": 0, "media_merged": 0}
+    if dry_run or not groups:
+        for target, names in groups.items():
+            # the first copy becomes the target unless those bytes are already stored
+            dupes = names if os.path.exists(os.path.join(upload_dir, target)) else names[1:]
+            report["removed"] += len(dupes)
+            report["bytes_reclaimed"] += sum(os.path.getsize(os.path.join(upload_dir, n)) for n in dupes)
+        return report
+
+    linked = set()
+    cur = conn.cursor()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for target, names in groups.items():
+            sha256 = os.path.splitext(target)[0]
+            target_url = _url_for(target, image_base)
+            target_path = os.path.join(upload_dir, target)
+            if not os.path.exists(target_path):
+                os.link(os.path.join(upload_dir, names[0]), target_path)
+                linked.add(target)
+            # rows for the surviving name plus every legacy name, oldest first
+            old_urls = [_url_for(n, image_base) for n in names]
+            marks = ",".join("?" * (len(names) + 1))
+            cur.execute(
+                f"SELECT id, refs FROM media WHERE source IS NULL AND filename IN ({marks}) ORDER BY id",
+                [target] + names,
+            )
+            rows = cur.fetchall()
+            cur.execute(f"UPDATE products SET image_url=? WHERE image_url IN ({','.join('?' * len(old_urls))})",
+                        [target_url] + old_urls)
+            product_refs = cur.rowcount
+            report["products_repointed"] += product_refs
+            refs = sum(r[1] for r in rows) + product_refs
+            if rows:
+                keep = rows[0][0]
+                dropped = [r[0] for r in rows[1:]]
+                if dropped:
+                    cur.execute(f"DELETE FROM media WHERE id IN ({','.join('?' * len(dropped))})", dropped)
+                    report["media_merged"] += len(dropped)
+                # a row already repointed at blob storage keeps that URL
+                cur.execute(
+                    "UPDATE media SET filename=?, url=CASE WHEN url LIKE '%/images/' || filename THEN ? ELSE url END, "
+                    "sha256=?, refs=? WHERE id=?",
+                    (target, target_url, sha256, refs, keep),
+                )
+            elif product_refs:
+                size = os.path.getsize(target_path)
+                cur.execute("INSERT INTO media(filename, url, size, sha256, refs) VALUES (?,?,?,?,?)",
+                            (target, target_url, size, sha256, refs))
+            # derivatives follow their original; identical renditions collapse
+            cur.execute(f"UPDATE media SET source=? WHERE source IN ({','.join('?' * len(names))})", [target] + names)
+        cur.execute(
+            "DELETE FROM media WHERE source IS NOT NULL AND id NOT IN "
+            "(SELECT MIN(id) FROM media WHERE source IS NOT NULL GROUP BY source, filename)"
+        )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    # legacy names are unreferenced once the transaction has committed
+    for target, names in groups.items():
+        for i, name in enumerate(names):
+            path = os.path.join(upload_dir, name)
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                continue
+            if i == 0 and target in linked:
+                continue  # same inode as the target; only the name went away
+            report["removed"] += 1
+            report["bytes_reclaimed"] += size
+    return report
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--dry-run", action="store_true", help="report what would be removed without changing anything")
+    args = ap.parse_args()
+    url = os.getenv("DATABASE_URL") or os.getenv("DB_PATH", "/data/shop.db")
+    upload_dir = os.getenv("UPLOAD_DIR", "/data/uploads")
+    conn = connect(url)
+    try:
+        migrate(conn)
+        report = compact(conn, upload_dir, os.getenv("IMAGE_BASE", ""), dry_run=args.dry_run)
+    finally:
+        conn.close()
+    print(" ".join(f"{k}={v}" for k, v in report.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""Counters and histograms rendered in the Prometheus text format.
+
+Instruments are updated in place from any thread; figures the app already
+keeps (pool, lane and cache stats) are read at scrape time by collectors, so
+the hot paths only pay for what is not counted anywhere else.
+
+Every SQL statement is timed (``record_query``) into one histogram and, when
+it runs on behalf of a request, into that request's tally, which
+``MetricsMiddleware`` turns into per-route query count and DB time histograms.
+"""
+import bisect
+import contextvars
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Family(NamedTuple):
+    """One metric as rendered. Samples are (name suffix, labels, value), the
+    suffix being "" except for histogram _bucket/_sum/_count lines."""
+
+    name: str
+    kind: str
+    help: str
+    samples: List[Tuple[str, Dict[str, str], float]]
+
+
+def gauge(name: str, help: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> Family:
+    return Family(name, "gauge", help, [("", labels, value) for labels, value in samples])
+
+
+def counter(name: str, help: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> Family:
+    return Family(name, "counter", help, [("", labels, value) for labels, value in samples])
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if value.is_integer() and abs(value) < 1e15:
+            return str(int(value))
+    return repr(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric) -> None:
+        with self._lock:
+            self._metrics.append(metric)
+
+    def collector(self, fn: Callable[[], Iterable[Family]]) -> Callable[[], Iterable[Family]]:
+        """Call ``fn`` at every scrape for point-in-time families; usable as
+        a decorator."""
+        with self._lock:
+            self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        with self._lock:
+            metrics, collectors = list(self._metrics), list(self._collectors)
+        families = [m.collect() for m in metrics]
+        for fn in collectors:
+            families.extend(fn())
+        out = []
+        for fam in families:
+            out.append(f"# HELP {fam.name} {fam.help}")
+            out.append(f"# TYPE {fam.name} {fam.kind}")
+            for suffix, labels, value in fam.samples:
+                text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                out.append(f"{fam.name}{suffix}{{{text}}} {_number(value)}" if text else f"{fam.name}{suffix} {_number(value)}")
+        out.append("")
+        return "\n".join(out)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), registry: Optional[Registry] = None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels[k]) for k in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(tuple(str(labels[k]) for k in self.labels), 0)
+
+    def collect(self) -> Family:
+        with self._lock:
+            items = sorted(self._values.items())
+        return Family(self.name, "counter", self.help, [("", dict(zip(self.labels, k)), v) for k, v in items])
+
+
+class Histogram:
+    """Cumulative ``le`` buckets plus _sum and _count per label set."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS,
+                 registry: Optional[Registry] = None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [observations per bucket (last one is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[k]) for k in self.labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def collect(self) -> Family:
+        with self._lock:
+            items = sorted((k, list(v[0]), v[1]) for k, v in self._values.items())
+        samples = []
+        for key, counts, total in items:
+            base = dict(zip(self.labels, key))
+            running = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                running += n
+                samples.append(("_bucket", {**base, "le": _number(float(bound))}, running))
+            samples.append(("_sum", base, total))
+            samples.append(("_count", base, running))
+        return Family(self.name, "histogram", self.help, samples)
+
+
+registry = Registry()
+
+db_query_seconds = Histogram(
+    "db_query_duration_seconds", "Time to execute one SQL statement.", buckets=QUERY_BUCKETS, registry=registry
+)
+
+# per-request [statements, seconds]; a list mutated in place so statements run
+# on worker threads (which get a copy of the context) still add to it
+_request_queries: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("request_queries", default=None)
+
+
+def record_query(seconds: float) -> None:
+    db_query_seconds.observe(seconds)
+    tally = _request_queries.get()
+    if tally is not None:
+        tally[0] += 1
+        tally[1] += seconds
+
+
+http_requests = Counter("http_requests_total", "Requests by route template, method and status.",
+                        ("route", "method", "status"), registry)
+http_latency = Histogram("http_request_duration_seconds", "Request latency by route template.",
+                         ("route", "method"), LATENCY_BUCKETS, registry)
+http_queries = Histogram("http_request_db_queries", "SQL statements run per request.",
+                         ("route",), COUNT_BUCKETS, registry)
+http_db_seconds = Histogram("http_request_db_seconds", "Time spent in SQL per request.",
+                            ("route",), LATENCY_BUCKETS, registry)
+_in_flight = [0]
+registry.collector(lambda: [gauge("http_requests_in_flight", "Requests being served.", [({}, _in_flight[0])])])
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests by route template and status and
+    timing them, along with the SQL each one ran."""
+
+    def __init__(self, app, route: Callable[[dict], str]):
+        self.app = app
+        self.route = route
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = [500]
+        tally = [0, 0.0]
+        token = _request_queries.set(tally)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        _in_flight[0] += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _in_flight[0] -= 1
+            _request_queries.reset(token)
+            route = self.route(scope)
+            method = scope["method"]
+            http_requests.inc(route=route, method=method, status=status[0])
+            http_latency.observe(time.perf_counter() - started, route=route, method=method)
+            http_queries.observe(tally[0], route=route)
+            http_db_seconds.observe(tally[1], route=route)
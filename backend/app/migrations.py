@@ -0,0 +1,578 @@
+import logging
+import sqlite3
+
+# Versioned schema migrations. Each step runs once per database; the applied
+# version lives in PRAGMA user_version (cheap to read on every startup) and
+# each step is also recorded in schema_migrations for auditing.
+#
+# PostgreSQL databases (DATABASE_URL=postgresql://...) have no legacy
+# history: they start from one step creating the schema as of version 6, and
+# every later step is added to both MIGRATIONS and PG_MIGRATIONS under the
+# same version number.
+
+_logger = logging.getLogger("app")
+
+
+def _columns(cur, table: str) -> set:
+    cur.execute(f"PRAGMA table_info({table});")
+    return {row[1] for row in cur.fetchall()}
+
+
+def _m001_base_schema(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS products(
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          sku TEXT,
+          name TEXT,
+          description TEXT,
+          price REAL,
+          image_url TEXT,
+          stock INTEGER DEFAULT 100
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS carts(
+          cart_id TEXT,
+          product_id INTEGER,
+          qty INTEGER,
+          PRIMARY KEY(cart_id, product_id)
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS orders(
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          cart_id TEXT,
+          total REAL,
+          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS order_items(
+          order_id INTEGER,
+          product_id INTEGER,
+          qty INTEGER,
+          price REAL
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users(
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          username TEXT UNIQUE,
+          password_hash TEXT,
+          is_admin INTEGER DEFAULT 0,
+          is_active INTEGER DEFAULT 1,
+          last_login TIMESTAMP,
+          must_change_password INTEGER DEFAULT 0,
+          full_name TEXT,
+          birthdate TEXT,
+          email TEXT,
+          phone TEXT,
+          zipcode TEXT,
+          address TEXT,
+          address2 TEXT,
+          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS categories(
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          name TEXT,
+          slug TEXT UNIQUE,
+          sort INTEGER DEFAULT 0
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS product_categories(
+          product_id INTEGER,
+          category_id INTEGER,
+          PRIMARY KEY(product_id, category_id)
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS media(
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          filename TEXT,
+          url TEXT,
+          size INTEGER,
+          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS coupons(
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          code TEXT UNIQUE,
+          type TEXT,
+          value REAL,
+          active INTEGER DEFAULT 1,
+          valid_from TEXT,
+          valid_to TEXT,
+          min_amount REAL DEFAULT 0
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS cart_discounts(
+          cart_id TEXT PRIMARY KEY,
+          code TEXT,
+          discount REAL
+        );
+        """
+    )
+    cur.execute("CREATE TABLE IF NOT EXISTS settings(key TEXT PRIMARY KEY, value TEXT)")
+
+    # databases created before versioning may lack later columns
+    cols = _columns(cur, "products")
+    if "image_url" not in cols:
+        cur.execute("ALTER TABLE products ADD COLUMN image_url TEXT;")
+    if "stock" not in cols:
+        cur.execute("ALTER TABLE products ADD COLUMN stock INTEGER DEFAULT 100;")
+    ocols = _columns(cur, "orders")
+    if "status" not in ocols:
+        cur.execute("ALTER TABLE orders ADD COLUMN status TEXT DEFAULT 'pending';")
+    ucols = _columns(cur, "users")
+    if "is_active" not in ucols:
+        cur.execute("ALTER TABLE users ADD COLUMN is_active INTEGER DEFAULT 1;")
+    if "last_login" not in ucols:
+        cur.execute("ALTER TABLE users ADD COLUMN last_login TIMESTAMP;")
+
+
+def _m002_query_indexes(cur):
+    # order lines are always fetched by order
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id, product_id, qty, price)")
+    # dashboard COUNT/SUM over a created_at window is answered from the index alone
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_created_total ON orders(created_at, total)")
+    # admin order list: status filter, newest first
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_total ON orders(total)")
+    # category listing joins from category to product
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_product_categories_category ON product_categories(category_id, product_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_categories_sort ON categories(sort, id DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_products_sku ON products(sku)")
+
+
+def _m003_product_search(cur):
+    # external-content FTS5 index over products; the trigram tokenizer gives
+    # substring matches that work for Korean text without word segmentation
+    cur.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+          name, description, sku,
+          content='products', content_rowid='id',
+          tokenize='trigram'
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+          INSERT INTO products_fts(rowid, name, description, sku) VALUES (new.id, new.name, new.description, new.sku);
+        END;
+        """
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+          INSERT INTO products_fts(products_fts, rowid, name, description, sku) VALUES ('delete', old.id, old.name, old.description, old.sku);
+        END;
+        """
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, description, sku ON products BEGIN
+          INSERT INTO products_fts(products_fts, rowid, name, description, sku) VALUES ('delete', old.id, old.name, old.description, old.sku);
+          INSERT INTO products_fts(rowid, name, description, sku) VALUES (new.id, new.name, new.description, new.sku);
+        END;
+        """
+    )
+    cur.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+
+
+def _m004_product_sort_indexes(cur):
+    # keyset pagination on the public listing sort keys
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_products_price ON products(price, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_products_stock ON products(stock, id)")
+
+
+def _m005_image_derivatives(cur):
+    # derivative files are media rows pointing back at their original
+    if "source" not in _columns(cur, "media"):
+        cur.execute("ALTER TABLE media ADD COLUMN source TEXT;")
+        cur.execute("ALTER TABLE media ADD COLUMN width INTEGER;")
+        cur.execute("ALTER TABLE media ADD COLUMN format TEXT;")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_media_source ON media(source)")
+    if "thumbnail_url" not in _columns(cur, "products"):
+        cur.execute("ALTER TABLE products ADD COLUMN thumbnail_url TEXT;")
+
+
+def _m006_content_addressed_media(cur):
+    # one row per stored original; refs counts library entries and products using it
+    if "sha256" not in _columns(cur, "media"):
+        cur.execute("ALTER TABLE media ADD COLUMN sha256 TEXT;")
+        cur.execute("ALTER TABLE media ADD COLUMN refs INTEGER NOT NULL DEFAULT 1;")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_media_original ON media(filename) WHERE source IS NULL")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_media_url ON media(url)")
+
+
+def _m007_admin_listing_indexes(cur):
+    # keyset pagination of /admin/orders by date or total, ties broken by id
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_created_id ON orders(created_at, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_total_id ON orders(total, id)")
+    cur.execute("DROP INDEX IF EXISTS idx_orders_total")
+
+
+def _m008_sales_rollups(cur, money: str = "REAL"):
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS sales_rollup(
+          grain TEXT NOT NULL,
+          bucket TEXT NOT NULL,
+          orders INTEGER NOT NULL DEFAULT 0,
+          revenue {money} NOT NULL DEFAULT 0,
+          items INTEGER NOT NULL DEFAULT 0,
+          PRIMARY KEY (grain, bucket)
+        )
+        """
+    )
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS sales_rollup_status(
+          grain TEXT NOT NULL,
+          bucket TEXT NOT NULL,
+          status TEXT NOT NULL,
+          orders INTEGER NOT NULL DEFAULT 0,
+          revenue {money} NOT NULL DEFAULT 0,
+          PRIMARY KEY (grain, bucket, status)
+        )
+        """
+    )
+    from .rollups import rebuild
+
+    rebuild(cur)
+
+
+def _result_columns(cur, table: str) -> set:
+    # the column list from a row-less SELECT works on both backends
+    cur.execute(f"SELECT * FROM {table} WHERE 1 = 0")
+    return {d[0] for d in cur.description}
+
+
+def _m009_cart_activity(cur, now: str = "CURRENT_TIMESTAMP"):
+    # existing carts start their TTL at the upgrade rather than expiring at once
+    for table in ("carts", "cart_discounts"):
+        if "touched_at" not in _result_columns(cur, table):
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN touched_at TEXT")
+        cur.execute(f"UPDATE {table} SET touched_at = {now} WHERE touched_at IS NULL")
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_touched ON {table}(touched_at)")
+
+
+def _m010_coupon_limits(cur, id_type: str = "INTEGER", money: str = "REAL",
+                        created: str = "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"):
+    cols = _result_columns(cur, "coupons")
+    # NULL limits are unlimited
+    for col, decl in (("max_uses", "INTEGER"), ("max_uses_per_user", "INTEGER"), ("uses", "INTEGER NOT NULL DEFAULT 0")):
+        if col not in cols:
+            cur.execute(f"ALTER TABLE coupons ADD COLUMN {col} {decl}")
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS coupon_redemptions(
+          order_id {id_type} PRIMARY KEY,
+          coupon_id {id_type} NOT NULL,
+          user_id {id_type},
+          discount {money},
+          created_at {created}
+        )
+        """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_coupon_redemptions_user ON coupon_redemptions(coupon_id, user_id)")
+
+
+MIGRATIONS = [
+    (1, "base schema", _m001_base_schema),
+    (2, "query indexes", _m002_query_indexes),
+    (3, "product search index", _m003_product_search),
+    (4, "product sort indexes", _m004_product_sort_indexes),
+    (5, "image derivatives", _m005_image_derivatives),
+    (6, "content-addressed media", _m006_content_addressed_media),
+    (7, "admin listing indexes", _m007_admin_listing_indexes),
+    (8, "sales rollups", _m008_sales_rollups),
+    (9, "cart activity", _m009_cart_activity),
+    (10, "coupon limits", _m010_coupon_limits),
+]
+
+
+# PostgreSQL keeps SQLite's column types where the app compares or returns
+# them as text (timestamps are 'YYYY-MM-DD HH:MM:SS' strings in UTC), so both
+# backends answer every query identically.
+_PG_NOW = "to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')"
+
+
+def _pg001_schema(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS products(
+          id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+          sku TEXT,
+          name TEXT,
+          description TEXT,
+          price DOUBLE PRECISION,
+          image_url TEXT,
+          stock INTEGER DEFAULT 100,
+          thumbnail_url TEXT
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS carts(
+          cart_id TEXT,
+          product_id BIGINT,
+          qty INTEGER,
+          PRIMARY KEY(cart_id, product_id)
+        )
+        """
+    )
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS orders(
+          id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+          cart_id TEXT,
+          total DOUBLE PRECISION,
+          created_at TEXT DEFAULT {_PG_NOW},
+          status TEXT DEFAULT 'pending'
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS order_items(
+          order_id BIGINT,
+          product_id BIGINT,
+          qty INTEGER,
+          price DOUBLE PRECISION
+        )
+        """
+    )
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS users(
+          id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+          username TEXT UNIQUE,
+          password_hash TEXT,
+          is_admin INTEGER DEFAULT 0,
+          is_active INTEGER DEFAULT 1,
+          last_login TEXT,
+          must_change_password INTEGER DEFAULT 0,
+          full_name TEXT,
+          birthdate TEXT,
+          email TEXT,
+          phone TEXT,
+          zipcode TEXT,
+          address TEXT,
+          address2 TEXT,
+          created_at TEXT DEFAULT {_PG_NOW}
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS categories(
+          id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+          name TEXT,
+          slug TEXT UNIQUE,
+          sort INTEGER DEFAULT 0
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS product_categories(
+          product_id BIGINT,
+          category_id BIGINT,
+          PRIMARY KEY(product_id, category_id)
+        )
+        """
+    )
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS media(
+          id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+          filename TEXT,
+          url TEXT,
+          size BIGINT,
+          created_at TEXT DEFAULT {_PG_NOW},
+          source TEXT,
+          width INTEGER,
+          format TEXT,
+          sha256 TEXT,
+          refs INTEGER NOT NULL DEFAULT 1
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS coupons(
+          id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+          code TEXT UNIQUE,
+          type TEXT,
+          value DOUBLE PRECISION,
+          active INTEGER DEFAULT 1,
+          valid_from TEXT,
+          valid_to TEXT,
+          min_amount DOUBLE PRECISION DEFAULT 0
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS cart_discounts(
+          cart_id TEXT PRIMARY KEY,
+          code TEXT,
+          discount DOUBLE PRECISION
+        )
+        """
+    )
+    cur.execute("CREATE TABLE IF NOT EXISTS settings(key TEXT PRIMARY KEY, value TEXT)")
+    # same indexes as SQLite migrations 2 to 6
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id, product_id, qty, price)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_created_total ON orders(created_at, total)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_total ON orders(total)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_product_categories_category ON product_categories(category_id, product_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_categories_sort ON categories(sort, id DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_products_sku ON products(sku)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_products_price ON products(price, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_products_stock ON products(stock, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_media_source ON media(source)")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_media_original ON media(filename) WHERE source IS NULL")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_media_url ON media(url)")
+    # product search is ILIKE on these columns; trigram indexes keep it off a
+    # sequential scan where the pg_trgm extension is available
+    cur.execute("SAVEPOINT trgm")
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except Exception:
+        cur.execute("ROLLBACK TO trgm")
+        _logger.warning("pg_trgm unavailable; product search will scan the products table")
+    else:
+        for col in ("name", "description", "sku"):
+            cur.execute(f"CREATE INDEX IF NOT EXISTS idx_products_{col}_trgm ON products USING gin ({col} gin_trgm_ops)")
+    cur.execute("RELEASE trgm")
+
+
+PG_MIGRATIONS = [
+    (6, "schema", _pg001_schema),
+    (7, "admin listing indexes", _m007_admin_listing_indexes),
+    (8, "sales rollups", lambda cur: _m008_sales_rollups(cur, "DOUBLE PRECISION")),
+    (9, "cart activity", lambda cur: _m009_cart_activity(cur, _PG_NOW)),
+    (10, "coupon limits", lambda cur: _m010_coupon_limits(cur, "BIGINT", "DOUBLE PRECISION", f"TEXT DEFAULT {_PG_NOW}")),
+]
+
+
+def schema_version(conn) -> int:
+    if getattr(conn, "dialect", "sqlite") == "postgresql":
+        if conn.execute("SELECT to_regclass('schema_migrations')").fetchone()[0] is None:
+            return 0
+        return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()[0]
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _migrate_pg(conn) -> int:
+    if schema_version(conn) >= PG_MIGRATIONS[-1][0]:
+        conn.rollback()
+        return 0
+    applied = 0
+    try:
+        cur = conn.cursor()
+        # one migrator at a time across every node sharing the database
+        cur.execute("SELECT pg_advisory_xact_lock(7140621)")
+        cur.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS schema_migrations(
+              version INTEGER PRIMARY KEY,
+              name TEXT,
+              applied_at TEXT DEFAULT {_PG_NOW}
+            )
+            """
+        )
+        current = schema_version(conn)
+        for version, name, step in PG_MIGRATIONS:
+            if version <= current:
+                continue
+            step(cur)
+            cur.execute("INSERT INTO schema_migrations(version, name) VALUES (?,?)", (version, name))
+            applied += 1
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return applied
+
+
+def migrate(conn) -> int:
+    """Apply pending migrations; returns how many ran."""
+    if getattr(conn, "dialect", "sqlite") == "postgresql":
+        return _migrate_pg(conn)
+    latest = MIGRATIONS[-1][0]
+    if schema_version(conn) >= latest:
+        return 0
+    # take the write lock first so concurrent workers don't both migrate
+    conn.execute("BEGIN IMMEDIATE")
+    applied = 0
+    try:
+        current = schema_version(conn)
+        cur = conn.cursor()
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations(
+              version INTEGER PRIMARY KEY,
+              name TEXT,
+              applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            """
+        )
+        for version, name, step in MIGRATIONS:
+            if version <= current:
+                continue
+            step(cur)
+            cur.execute("INSERT INTO schema_migrations(version, name) VALUES (?,?)", (version, name))
+            cur.execute(f"PRAGMA user_version={int(version)}")
+            applied += 1
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if applied:
+        conn.execute("PRAGMA optimize")
+    return applied
+
+
+if __name__ == "__main__":
+    import os
+
+    from .db import connect
+
+    url = os.getenv("DATABASE_URL") or os.getenv("DB_PATH", "/data/shop.db")
+    conn = connect(url)
+    n = migrate(conn)
+    print(f"{url.rpartition('@')[2]}: applied {n} migration(s), schema version {schema_version(conn)}")
+    conn.close()
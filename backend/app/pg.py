@@ -0,0 +1,234 @@
+"""PostgreSQL behind the connection interface the handlers already use.
+
+Handlers are written against ``sqlite3``: ``?`` placeholders, ``execute`` on
+the connection, ``commit``/``rollback`` and ``in_transaction``. ``PgConnection``
+offers the same surface over psycopg2 so the pools, the async lanes and the
+group-committing writer work unchanged with ``DATABASE_URL=postgresql://...``.
+
+Statements that run often on a connection are turned into server-side
+prepared statements (``PREPARE``/``EXECUTE``): after ``DB_PREPARE_THRESHOLD``
+executions a statement is parsed and planned once per connection, and up to
+``DB_STATEMENT_CACHE`` of them are kept per connection.
+"""
+import os
+import re
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+
+from .metrics import record_query
+
+DB_PREPARE_THRESHOLD = int(os.getenv("DB_PREPARE_THRESHOLD", "5"))
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+
+Error = psycopg2.Error
+IntegrityError = psycopg2.IntegrityError
+
+_PREPARABLE = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH|VALUES)\b", re.I)
+_BEGIN = re.compile(r"^\s*BEGIN(\s+(DEFERRED|IMMEDIATE|EXCLUSIVE))?\s*;?\s*$", re.I)
+
+
+@lru_cache(maxsize=1024)
+def translate(sql: str) -> Tuple[str, str, int]:
+    """Rewrite ``?`` placeholders outside string literals and quoted names.
+
+    Returns (sql with ``%s`` placeholders and ``%`` escaped for psycopg2,
+    sql with ``$n`` placeholders for PREPARE, number of placeholders).
+    """
+    pyformat, numbered = [], []
+    n = 0
+    quote = None
+    for ch in sql.strip().rstrip(";"):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"'):
+            quote = ch
+        elif ch == "?":
+            n += 1
+            pyformat.append("%s")
+            numbered.append(f"${n}")
+            continue
+        pyformat.append("%%" if ch == "%" else ch)
+        numbered.append(ch)
+    return "".join(pyformat), "".join(numbered), n
+
+
+class PgCursor:
+    """The subset of ``sqlite3.Cursor`` the app uses."""
+
+    def __init__(self, conn: "PgConnection"):
+        self._conn = conn
+        self._cur = conn.raw.cursor()
+
+    def execute(self, sql: str, params=()) -> "PgCursor":
+        started = time.perf_counter()
+        try:
+            self._conn._execute(self._cur, sql, tuple(params))
+        finally:
+            record_query(time.perf_counter() - started)
+        return self
+
+    def executemany(self, sql: str, seq) -> "PgCursor":
+        started = time.perf_counter()
+        try:
+            self._conn._executemany(self._cur, sql, [tuple(p) for p in seq])
+        finally:
+            record_query(time.perf_counter() - started)
+        return self
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def fetchmany(self, size: int = 1):
+        return self._cur.fetchmany(size)
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    @property
+    def rowcount(self) -> int:
+        return self._cur.rowcount
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    def close(self) -> None:
+        self._cur.close()
+
+
+class PgConnection:
+    """A psycopg2 connection that looks like a ``sqlite3.Connection``.
+
+    ``autocommit=True`` matches sqlite3's ``isolation_level=None``: the caller
+    issues BEGIN/SAVEPOINT/COMMIT itself. Otherwise a transaction starts with
+    the first statement and lasts until ``commit()``/``rollback()``.
+    ``BEGIN IMMEDIATE`` becomes a plain BEGIN; the statements that relied on
+    SQLite's single write lock guard themselves (e.g. ``stock >= ?``).
+    """
+
+    dialect = "postgresql"
+
+    def __init__(self, dsn: str, autocommit: bool = False, prepare_threshold: int = DB_PREPARE_THRESHOLD,
+                 statement_cache: int = DB_STATEMENT_CACHE):
+        self.raw = psycopg2.connect(dsn, connect_timeout=DB_CONNECT_TIMEOUT, client_encoding="utf8")
+        self.raw.autocommit = autocommit
+        self.prepare_threshold = prepare_threshold
+        self.statement_cache = statement_cache
+        # sql -> prepared statement name, or an int count of executions so far
+        self._statements = OrderedDict()
+        self._names = 0
+        self.prepared = 0
+        self.prepare_failures = 0
+
+    @property
+    def in_transaction(self) -> bool:
+        return self.raw.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self) -> PgCursor:
+        return PgCursor(self)
+
+    def execute(self, sql: str, params=()) -> PgCursor:
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql: str, seq) -> PgCursor:
+        return self.cursor().executemany(sql, seq)
+
+    def commit(self) -> None:
+        if self.raw.autocommit:
+            if self.in_transaction:
+                self.raw.cursor().execute("COMMIT")
+        else:
+            self.raw.commit()
+
+    def rollback(self) -> None:
+        if self.raw.autocommit:
+            if self.in_transaction:
+                self.raw.cursor().execute("ROLLBACK")
+        else:
+            self.raw.rollback()
+
+    def close(self) -> None:
+        self.raw.close()
+
+    def _statement(self, cur, sql: str) -> Optional[str]:
+        """Name of the prepared statement for ``sql``, preparing it once it
+        has run ``prepare_threshold`` times; None to send it as text."""
+        entry = self._statements.get(sql)
+        if isinstance(entry, str):
+            self._statements.move_to_end(sql)
+            return entry
+        if entry is False or self.prepare_threshold <= 0 or not _PREPARABLE.match(sql):
+            return None
+        count = (entry or 0) + 1
+        if count < self.prepare_threshold:
+            self._remember(cur, sql, count)
+            return None
+        self._names += 1
+        name = f"s{self._names}"
+        # a failed PREPARE must not abort the caller's transaction
+        nested = self.in_transaction
+        try:
+            if nested:
+                cur.execute("SAVEPOINT prepare")
+            cur.execute(f"PREPARE {name} AS {translate(sql)[1]}")
+            if nested:
+                cur.execute("RELEASE prepare")
+        except psycopg2.Error:
+            # e.g. a parameter whose type cannot be inferred: keep sending text
+            if nested:
+                cur.execute("ROLLBACK TO prepare")
+                cur.execute("RELEASE prepare")
+            elif not self.raw.autocommit:
+                self.raw.rollback()
+            self.prepare_failures += 1
+            self._remember(cur, sql, False)
+            return None
+        self.prepared += 1
+        self._remember(cur, sql, name)
+        return name
+
+    def _remember(self, cur, sql: str, entry) -> None:
+        self._statements[sql] = entry
+        self._statements.move_to_end(sql)
+        while len(self._statements) > self.statement_cache:
+            _, old = self._statements.popitem(last=False)
+            if isinstance(old, str):
+                cur.execute(f"DEALLOCATE {old}")
+
+    def _execute(self, cur, sql: str, params: tuple) -> None:
+        if _BEGIN.match(sql):
+            # psycopg2 opens the transaction itself unless in autocommit mode
+            if self.raw.autocommit:
+                cur.execute("BEGIN")
+            return
+        name = self._statement(cur, sql)
+        if name is None:
+            pyformat, _, n = translate(sql)
+            cur.execute(pyformat if n else pyformat.replace("%%", "%"), params if n else None)
+        elif params:
+            cur.execute(f"EXECUTE {name}({','.join(['%s'] * len(params))})", params)
+        else:
+            cur.execute(f"EXECUTE {name}")
+
+    def _executemany(self, cur, sql: str, seq: list) -> None:
+        if not seq:
+            return
+        name = self._statement(cur, sql)
+        if name is None:
+            cur.executemany(translate(sql)[0], seq)
+        else:
+            cur.executemany(f"EXECUTE {name}({','.join(['%s'] * len(seq[0]))})", seq)
+
+
+def connect(dsn: str, autocommit: bool = False) -> PgConnection:
+    return PgConnection(dsn, autocommit=autocommit)
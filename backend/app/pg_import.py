@@ -0,0 +1,167 @@
+"""Copy an existing SQLite shop database into PostgreSQL.
+
+Brings the SQLite file up to the latest schema, creates the PostgreSQL
+schema, then streams every table through ``COPY ... FROM STDIN`` inside one
+transaction, so the target either receives everything or nothing. Identity
+sequences are moved past the copied ids and row counts are checked before
+committing. The target tables must be empty unless ``--truncate`` is given.
+
+Run from backend/:  python -m app.pg_import [--source /data/shop.db] [--target postgresql://...] [--truncate]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from typing import List
+
+from .db import connect
+from .migrations import migrate
+
+# parents before children; the FTS index is rebuilt by PostgreSQL's own indexes
+TABLES = [
+    "users",
+    "categories",
+    "products",
+    "product_categories",
+    "media",
+    "coupons",
+    "coupon_redemptions",
+    "orders",
+    "order_items",
+    "carts",
+    "cart_discounts",
+    "settings",
+    "sales_rollup",
+    "sales_rollup_status",
+]
+COPY_CHUNK_ROWS = 5000
+
+_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _text_field(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", errors="replace")
+    return str(value).translate(_ESCAPES)
+
+
+class _CopyStream:
+    """File-like reader over rows in COPY text format, read lazily from a
+    SQLite cursor so a table never has to fit in memory."""
+
+    def __init__(self, rows: sqlite3.Cursor):
+        self._rows = rows
+        self._buf = b""
+        self.count = 0
+
+    def _fill(self, size: int) -> None:
+        parts = [self._buf]
+        have = len(self._buf)
+        while size < 0 or have < size:
+            chunk = self._rows.fetchmany(COPY_CHUNK_ROWS)
+            if not chunk:
+                break
+            self.count += len(chunk)
+            data = "".join("\t".join(_text_field(v) for v in row) + "\n" for row in chunk).encode("utf-8")
+            parts.append(data)
+            have += len(data)
+        self._buf = b"".join(parts)
+
+    def read(self, size: int = -1) -> bytes:
+        self._fill(size)
+        if size < 0:
+            out, self._buf = self._buf, b""
+        else:
+            out, self._buf = self._buf[:size], self._buf[size:]
+        return out
+
+
+def _sqlite_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _pg_columns(cur, table: str) -> List[str]:
+    cur.execute(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = %s ORDER BY ordinal_position",
+        (table,),
+    )
+    return [r[0] for r in cur.fetchall()]
+
+
+def copy_database(source: sqlite3.Connection, target, truncate: bool = False) -> dict:
+    """Copy every table in TABLES; returns {table: rows}. ``target`` is a
+    migrated PgConnection."""
+    raw = target.raw
+    cur = raw.cursor()
+    report = {}
+    try:
+        if truncate:
+            cur.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY")
+        else:
+            busy = []
+            for table in TABLES:
+                cur.execute(f"SELECT EXISTS (SELECT 1 FROM {table})")
+                if cur.fetchone()[0]:
+                    busy.append(table)
+            if busy:
+                raise SystemExit(f"target tables not empty: {', '.join(busy)} (use --truncate to replace them)")
+        for table in TABLES:
+            pg_cols = set(_pg_columns(cur, table))
+            cols = [c for c in _sqlite_columns(source, table) if c in pg_cols]
+            started = time.monotonic()
+            stream = _CopyStream(source.execute(f"SELECT {', '.join(cols)} FROM {table}"))
+            cur.copy_expert(f"COPY {table} ({', '.join(cols)}) FROM STDIN", stream, size=1 << 20)
+            cur.execute(f"SELECT COUNT(*) FROM {table}")
+            copied = cur.fetchone()[0]
+            expected = source.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            if copied != expected:
+                raise RuntimeError(f"{table}: copied {copied} rows, source has {expected}")
+            if "id" in pg_cols:
+                # identity columns keep generating after the highest copied id
+                cur.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {table}"
+                )
+            report[table] = copied
+            print(f"{table}: {copied} rows in {time.monotonic() - started:.2f}s", flush=True)
+        raw.commit()
+    except BaseException:
+        raw.rollback()
+        raise
+    raw.autocommit = True
+    try:
+        cur.execute(f"ANALYZE {', '.join(TABLES)}")
+    finally:
+        raw.autocommit = False
+    return report
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--source", default=os.getenv("DB_PATH", "/data/shop.db"), help="SQLite file to copy")
+    ap.add_argument("--target", default=os.getenv("DATABASE_URL"), help="postgresql:// URL (default: DATABASE_URL)")
+    ap.add_argument("--truncate", action="store_true", help="empty the target tables first")
+    args = ap.parse_args()
+    if not args.target or not args.target.startswith(("postgres://", "postgresql://")):
+        ap.error("--target (or DATABASE_URL) must be a postgresql:// URL")
+    if not os.path.exists(args.source):
+        ap.error(f"{args.source} does not exist")
+
+    source = sqlite3.connect(args.source, timeout=30)
+    target = connect(args.target)
+    try:
+        migrate(source)
+        migrate(target)
+        report = copy_database(source, target, truncate=args.truncate)
+    finally:
+        source.close()
+        target.close()
+    print(f"copied {sum(report.values())} rows in {len(report)} tables")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
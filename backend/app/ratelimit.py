@@ -0,0 +1,211 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from .db import connect, dialect
+
+# memory (per process) or database (shared by all workers; "sqlite" is an alias)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+# where the shared buckets live; default: the PostgreSQL DATABASE_URL, or a
+# ratelimit.db file next to DB_PATH
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+LOGIN_USER_BURST = float(os.getenv("LOGIN_USER_BURST", "5"))
+LOGIN_USER_WINDOW = float(os.getenv("LOGIN_USER_WINDOW", "300"))
+LOGIN_IP_BURST = float(os.getenv("LOGIN_IP_BURST", "20"))
+LOGIN_IP_WINDOW = float(os.getenv("LOGIN_IP_WINDOW", "300"))
+
+
+def _refill(tokens: float, updated: float, capacity: float, rate: float, now: float) -> float:
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+def _spend(tokens: float, capacity: float, cost: float) -> Tuple[bool, float]:
+    """Take ``cost`` tokens if the bucket holds them; a negative cost gives
+    tokens back, up to ``capacity``."""
+    if cost > 0 and tokens < cost:
+        return False, tokens
+    return True, min(capacity, tokens - cost)
+
+
+class MemoryBackend:
+    """Token buckets in a per-process dict.
+
+    A bucket that has refilled completely carries no information, so entries
+    idle for longer than a full refill are dropped; the LRU bound caps memory
+    even under a flood of distinct keys.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float) -> None:
+        while self._buckets:
+            key, (tokens, updated, capacity, rate) = next(iter(self._buckets.items()))
+            if len(self._buckets) > self.max_keys or _refill(tokens, updated, capacity, rate, now) >= capacity:
+                del self._buckets[key]
+            else:
+                break
+
+    def consume(self, key: str, capacity: float, rate: float, cost: float, now: float) -> Tuple[bool, float]:
+        """Returns (spent, tokens left); nothing is spent when ``cost`` is not there."""
+        with self._lock:
+            item = self._buckets.pop(key, None)
+            tokens = capacity if item is None else _refill(item[0], item[1], capacity, rate, now)
+            ok, tokens = _spend(tokens, capacity, cost)
+            self._buckets[key] = (tokens, now, capacity, rate)
+            self._evict(now)
+            return ok, tokens
+
+    def reset(self, key: str) -> None:
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._buckets)
+
+
+class SqlBackend:
+    """Token buckets in a ``rate_limits`` table, shared by every worker using
+    the database.
+
+    On SQLite the table lives in a file of its own (see ``make_backend``), so
+    failed logins never queue for the shop database's write lock; on
+    PostgreSQL it lives in the configured database and each update locks just
+    the bucket's row.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.dialect = dialect(url)
+        self._lock = threading.Lock()
+        self._conn = connect(url, isolation_level=None)
+        real = "DOUBLE PRECISION" if self.dialect == "postgresql" else "REAL"
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS rate_limits(key TEXT PRIMARY KEY, tokens {real}, updated_at {real}, full_at {real})"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_rate_limits_full_at ON rate_limits(full_at)")
+        # SQLite's BEGIN IMMEDIATE already serialises writers across processes
+        self._select = "SELECT tokens, updated_at FROM rate_limits WHERE key=?" + (
+            " FOR UPDATE" if self.dialect == "postgresql" else "")
+        self._writes = 0
+
+    def consume(self, key: str, capacity: float, rate: float, cost: float, now: float) -> Tuple[bool, float]:
+        """Returns (spent, tokens left); nothing is spent when ``cost`` is not there."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # make sure there is a row to lock
+                self._conn.execute(
+                    "INSERT INTO rate_limits(key, tokens, updated_at, full_at) VALUES (?,?,?,?) ON CONFLICT(key) DO NOTHING",
+                    (key, capacity, now, now),
+                )
+                row = self._conn.execute(self._select, (key,)).fetchone()
+                ok, tokens = _spend(_refill(row[0], row[1], capacity, rate, now), capacity, cost)
+                if ok:
+                    full_at = now + (capacity - tokens) / rate if rate > 0 else float("inf")
+                    self._conn.execute(
+                        "UPDATE rate_limits SET tokens=?, updated_at=?, full_at=? WHERE key=?", (tokens, now, full_at, key)
+                    )
+                self._writes += 1
+                if self._writes % 256 == 0:
+                    # rows whose bucket is full again are equivalent to no row
+                    self._conn.execute("DELETE FROM rate_limits WHERE full_at <= ?", (now,))
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            return ok, tokens
+
+    def reset(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM rate_limits WHERE key=?", (key,))
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM rate_limits").fetchone()[0]
+
+
+class LoginRateLimiter:
+    """Token buckets of failed login attempts per client IP and per username.
+
+    A bucket holds ``burst`` tokens and refills completely over ``window``
+    seconds; each attempt spends one token, a successful one gets it back, and
+    an empty bucket blocks further attempts until a token has refilled.
+    """
+
+    def __init__(self, backend, user_burst: float = LOGIN_USER_BURST, user_window: float = LOGIN_USER_WINDOW,
+                 ip_burst: float = LOGIN_IP_BURST, ip_window: float = LOGIN_IP_WINDOW):
+        self.backend = backend
+        self.limits = {
+            "user": (user_burst, user_burst / user_window),
+            "ip": (ip_burst, ip_burst / ip_window),
+        }
+        self._lock = threading.Lock()
+        self.blocked = {"user": 0, "ip": 0}
+        self.failures = 0
+
+    def _keys(self, ip: str, username: str):
+        return (("ip", f"login:ip:{ip}"), ("user", f"login:user:{username.lower()}"))
+
+    def check(self, ip: str, username: str, now: Optional[float] = None) -> Tuple[bool, float]:
+        """Spend one token per bucket for an attempt about to be verified;
+        returns (allowed, retry_after_seconds). Taking the token before the
+        slow password check keeps concurrent guesses within the burst. An
+        allowed attempt must end in ``record_failure``, ``record_success`` or
+        ``release``."""
+        now = time.time() if now is None else now
+        taken = []
+        for scope, key in self._keys(ip, username):
+            capacity, rate = self.limits[scope]
+            ok, tokens = self.backend.consume(key, capacity, rate, 1.0, now)
+            if not ok:
+                for s, k in taken:
+                    self.backend.consume(k, *self.limits[s], -1.0, now)
+                with self._lock:
+                    self.blocked[scope] += 1
+                return False, (1.0 - tokens) / rate
+            taken.append((scope, key))
+        return True, 0.0
+
+    def record_failure(self, ip: str, username: str) -> None:
+        # the token spent by check() stays spent
+        with self._lock:
+            self.failures += 1
+
+    def record_success(self, ip: str, username: str, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        (ip_scope, ip_key), (_, user_key) = self._keys(ip, username)
+        # give the IP its token back but leave its earlier failures: a valid
+        # login must not clear an IP that is guessing other usernames
+        self.backend.consume(ip_key, *self.limits[ip_scope], -1.0, now)
+        self.backend.reset(user_key)
+
+    def release(self, ip: str, username: str, now: Optional[float] = None) -> None:
+        """Give back the tokens of an attempt that reached no verdict."""
+        now = time.time() if now is None else now
+        for scope, key in self._keys(ip, username):
+            self.backend.consume(key, *self.limits[scope], -1.0, now)
+
+    def counters(self) -> dict:
+        """Failures and blocked attempts so far; unlike ``stats`` never queries."""
+        with self._lock:
+            return {"failures": self.failures, "blocked": dict(self.blocked)}
+
+    def stats(self) -> dict:
+        return {"backend": type(self.backend).__name__, "tracked_keys": self.backend.size(), **self.counters()}
+
+
+def make_backend(database_url: str, db_path: str):
+    if RATE_LIMIT_BACKEND in ("database", "sqlite"):
+        if RATE_LIMIT_DB:
+            return SqlBackend(RATE_LIMIT_DB)
+        if dialect(database_url) == "postgresql":
+            return SqlBackend(database_url)
+        return SqlBackend(os.path.join(os.path.dirname(db_path), "ratelimit.db"))
+    return MemoryBackend()
@@ -0,0 +1,277 @@
+import hashlib
+import logging
+import os
+import queue
+import threading
+import uuid
+from concurrent.futures import Future
+from typing import Callable, NamedTuple, Optional
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(5 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(64 * 1024)))
+# room for the multipart framing and the other form fields around the file
+UPLOAD_FORM_OVERHEAD = int(os.getenv("UPLOAD_FORM_OVERHEAD", str(256 * 1024)))
+# "background": return the local URL and push to blob storage afterwards;
+# "sync": wait for the blob upload and return its URL
+BLOB_UPLOAD_MODE = os.getenv("BLOB_UPLOAD_MODE", "background")
+
+_logger = logging.getLogger("app")
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class StagedUpload(NamedTuple):
+    path: str
+    sha256: str
+    size: int
+
+
+def stage_upload(src, dest_dir: str, max_bytes: int = UPLOAD_MAX_BYTES) -> StagedUpload:
+    """Copy ``src`` into a temp file in ``dest_dir`` chunk by chunk, hashing as it goes.
+
+    The size limit is enforced while copying; the temp file is removed on any
+    failure. ``src`` is usually an UploadFile that Starlette has already
+    spooled, so this check alone bounds what is stored, not what is received;
+    ``BodySizeLimitMiddleware`` bounds the request body itself. Callers move it to its content-addressed name with
+    ``place_staged`` or drop it with ``discard_staged``.
+    """
+    tmp = os.path.join(dest_dir, f".upload-{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp, "wb") as out:
+            while True:
+                chunk = src.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"upload exceeds {max_bytes} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        discard_staged(tmp)
+        raise
+    return StagedUpload(tmp, digest.hexdigest(), size)
+
+
+class BodySizeLimitMiddleware:
+    """ASGI middleware answering 413 to request bodies over ``max_bytes``.
+
+    Starlette parses a multipart form, files included, before the handler
+    runs, so the server would otherwise receive and spool an upload of any
+    size. A declared Content-Length over the limit is refused before reading;
+    a chunked or understated body is cut off as soon as it passes the limit.
+    ``exempt(scope)`` is true for requests allowed any size.
+    """
+
+    def __init__(self, app, max_bytes: int, exempt: Callable[[dict], bool] = lambda scope: False):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.exempt = exempt
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.exempt(scope):
+            await self.app(scope, receive, send)
+            return
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            await self._refuse(send)
+            return
+        received = 0
+        state = {"over": False, "started": False}
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    state["over"] = True
+                    raise UploadTooLarge(f"request body exceeds {self.max_bytes} bytes")
+            return message
+
+        async def guarded_send(message):
+            # the app's own reply to the aborted read (e.g. a 400 from the
+            # form parser) is replaced by the 413
+            if state["over"] and not state["started"]:
+                return
+            if message["type"] == "http.response.start":
+                state["started"] = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadTooLarge:
+            if state["started"]:
+                raise
+        if state["over"] and not state["started"]:
+            await self._refuse(send)
+
+    async def _refuse(self, send) -> None:
+        body = f'{{"detail":"request body too large (max {self.max_bytes} bytes)"}}'.encode()
+        await send({"type": "http.response.start", "status": 413, "headers": [
+            (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+            (b"connection", b"close"),
+        ]})
+        await send({"type": "http.response.body", "body": body})
+
+
+def place_staged(staged: StagedUpload, dest_dir: str, fname: str) -> bool:
+    """Move a staged upload to ``dest_dir/fname`` unless those bytes are
+    already stored there. Returns True if a new file was created."""
+    dest = os.path.join(dest_dir, fname)
+    if os.path.exists(dest):
+        discard_staged(staged.path)
+        return False
+    os.replace(staged.path, dest)
+    return True
+
+
+def discard_staged(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    """One long-lived Azure container client; the container is ensured once."""
+
+    def __init__(self, conn_str: str, container: str):
+        self.conn_str = conn_str
+        self.container = container
+        self._client = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["BlobStore"]:
+        conn_str = os.getenv("AZURE_BLOB_CONNECTION_STRING")
+        container = os.getenv("AZURE_BLOB_CONTAINER")
+        if not conn_str or not container:
+            return None
+        return cls(conn_str, container)
+
+    def _container_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from azure.storage.blob import BlobServiceClient
+
+                    svc = BlobServiceClient.from_connection_string(self.conn_str)
+                    client = svc.get_container_client(self.container)
+                    try:
+                        client.create_container()
+                    except Exception:
+                        pass
+                    self._client = client
+        return self._client
+
+    def upload(self, path: str, blob_name: str, content_type: Optional[str] = None, cache_control: Optional[str] = None) -> str:
+        from azure.storage.blob import ContentSettings
+
+        blob = self._container_client().get_blob_client(blob_name)
+        settings = ContentSettings(content_type=content_type, cache_control=cache_control) if content_type or cache_control else None
+        with open(path, "rb") as f:
+            blob.upload_blob(f, overwrite=True, content_settings=settings)
+        return blob.url
+
+    def delete(self, blob_name: str) -> None:
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            self._container_client().get_blob_client(blob_name).delete_blob(delete_snapshots="include")
+        except ResourceNotFoundError:
+            pass  # never uploaded, or already gone
+
+
+class BlobTransferWorker:
+    """Background thread that copies already-saved uploads to blob storage
+    and deletes blobs whose media is gone, in the order they were queued.
+
+    ``on_done(local_url, blob_url)`` runs after each successful transfer so the
+    caller can repoint rows at the blob URL.
+    """
+
+    def __init__(self, store: BlobStore, on_done: Callable[[str, str], None]):
+        self.store = store
+        self.on_done = on_done
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.uploaded = 0
+        self.deleted = 0
+        self.failed = 0
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="blob-transfer", daemon=True)
+                    self._thread.start()
+
+    def submit(self, path: str, blob_name: str, content_type: Optional[str], local_url: str,
+               cache_control: Optional[str] = None) -> Future:
+        """Queue an upload; the future resolves to the blob URL once rows
+        have been repointed."""
+        self._ensure_started()
+        with self._lock:
+            self.submitted += 1
+        fut = Future()
+        self._queue.put((fut, path, blob_name, content_type, local_url, cache_control))
+        return fut
+
+    def delete(self, blob_name: str) -> None:
+        # queued behind any pending upload of the same name
+        self._ensure_started()
+        self._queue.put((None, None, blob_name, None, None, None))
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            fut, path, blob_name, content_type, local_url, cache_control = job
+            try:
+                if path is None:
+                    self.store.delete(blob_name)
+                    with self._lock:
+                        self.deleted += 1
+                    continue
+                url = self.store.upload(path, blob_name, content_type, cache_control)
+                self.on_done(local_url, url)
+                with self._lock:
+                    self.uploaded += 1
+                fut.set_result(url)
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                _logger.exception(f"blob {'delete' if path is None else 'transfer'} failed for {blob_name}")
+                if fut is not None:
+                    fut.set_exception(e)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "submitted": self.submitted,
+                "uploaded": self.uploaded,
+                "deleted": self.deleted,
+                "failed": self.failed,
+                "queued": self._queue.qsize(),
+            }
+
+    def stop(self, timeout: float = 10.0) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
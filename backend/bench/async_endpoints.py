@@ -0,0 +1,170 @@
+"""Throughput of the async hot endpoints against their previous sync versions.
+
+Run from backend/:  python -m bench.async_endpoints --concurrency 64 --requests 2000
+
+Starts uvicorn on a throwaway database with the app plus sync copies of the
+old handlers mounted under /sync, then drives both with the same load.
+THREADPOOL_SIZE (--threadpool) caps the sync variants; the catalog cache is
+disabled so every catalog request reaches the database.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+SCENARIOS = [
+    # name, method, path template (i = request number)
+    ("products", "GET", "/products?limit=24"),
+    ("product", "GET", "/products/{pid}"),
+    ("cart", "GET", "/cart?cart_id=bench-{c}"),
+    ("add", "POST", "/cart/items?cart_id=bench-{c}&product_id={pid}&qty=1"),
+]
+
+
+def make_app():
+    """uvicorn --factory target: the shop app with the pre-async handlers under /sync."""
+    import sqlite3
+
+    from fastapi import Depends, HTTPException, Query, Request
+
+    from app import main as shop
+
+    @shop.app.get("/sync/products")
+    def sync_list_products(request: Request, limit: int = Query(None), conn: sqlite3.Connection = Depends(shop.get_db)):
+        def build():
+            items, next_cursor = shop._list_products(conn.cursor(), None, None, "-id", limit, None)
+            return items, ({"X-Next-Cursor": next_cursor} if next_cursor else {})
+
+        return shop._catalog_response(request, ("sync-products", limit), build)
+
+    @shop.app.get("/sync/products/{pid}")
+    def sync_get_product(pid: int, request: Request, conn: sqlite3.Connection = Depends(shop.get_db)):
+        def build():
+            cur = conn.cursor()
+            cur.execute("SELECT id, sku, name, description, price, image_url, stock, thumbnail_url FROM products WHERE id=?", (pid,))
+            r = cur.fetchone()
+            if not r:
+                raise HTTPException(404, "not found")
+            cur.execute("SELECT c.id, c.name, c.slug FROM product_categories pc JOIN categories c ON c.id=pc.category_id WHERE pc.product_id=?", (pid,))
+            cats = [{"id": x[0], "name": x[1], "slug": x[2]} for x in cur.fetchall()]
+            return {"id": r[0], "sku": r[1], "name": r[2], "categories": cats}, {}
+
+        return shop._catalog_response(request, ("sync-product", pid), build)
+
+    @shop.app.get("/sync/cart")
+    def sync_get_cart(cart_id: str = Query(...), conn: sqlite3.Connection = Depends(shop.get_db)):
+        return shop._cart_view(conn.cursor(), cart_id)
+
+    @shop.app.post("/sync/cart/items")
+    def sync_add_cart_item(product_id: int, qty: int = 1, cart_id: str = Query(...), conn: sqlite3.Connection = Depends(shop.get_db)):
+        return shop._add_cart_item(conn, cart_id, product_id, qty)
+
+    return shop.app
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _drive(client: httpx.AsyncClient, method: str, template: str, requests: int, concurrency: int, pid: int) -> dict:
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker(c: int) -> None:
+        nonlocal errors
+        for i in counter:
+            path = template.format(i=i, c=c, pid=pid)
+            started = time.perf_counter()
+            r = await client.request(method, path)
+            latencies.append(time.perf_counter() - started)
+            if r.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(c) for c in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "rps": requests / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "errors": errors,
+    }
+
+
+async def run(base: str, requests: int, concurrency: int, pid: int) -> None:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=60) as client:
+        for name, method, template in SCENARIOS:
+            for variant, prefix in (("sync", "/sync"), ("async", "")):
+                await _drive(client, method, prefix + template, min(requests, 200), concurrency, pid)  # warm-up
+                r = await _drive(client, method, prefix + template, requests, concurrency, pid)
+                print(f"{name:9s} {variant:5s} rps={r['rps']:8.1f} p50={r['p50']:7.2f}ms p99={r['p99']:7.2f}ms errors={r['errors']}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--concurrency", type=int, default=64)
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--threadpool", type=int, default=40)
+    ap.add_argument("--products", type=int, default=200)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench-async-")
+    env = dict(os.environ)
+    env.setdefault("DB_PATH", os.path.join(tmp, "shop.db"))
+    env.setdefault("LOG_DIR", os.path.join(tmp, "logs"))
+    env.setdefault("UPLOAD_DIR", os.path.join(tmp, "uploads"))
+    env["THREADPOOL_SIZE"] = str(args.threadpool)
+    env["CATALOG_CACHE_TTL"] = "0"
+
+    import sqlite3
+
+    sys.path.insert(0, os.getcwd())
+    os.environ.update({k: env[k] for k in ("DB_PATH", "LOG_DIR", "UPLOAD_DIR")})
+    from app.migrations import migrate
+
+    os.makedirs(env["UPLOAD_DIR"], exist_ok=True)
+    conn = sqlite3.connect(env["DB_PATH"])
+    migrate(conn)
+    conn.executemany(
+        "INSERT INTO products(sku, name, description, price, image_url, stock) VALUES (?,?,?,?,?,?)",
+        [(f"BENCH-{i}", f"Bench item {i}", "bench product", 10.0 + i, "", 10**9) for i in range(args.products)],
+    )
+    conn.commit()
+    pid = conn.execute("SELECT MIN(id) FROM products").fetchone()[0]
+    conn.close()
+
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "--factory", "bench.async_endpoints:make_app",
+         "--port", str(port), "--log-level", "warning", "--no-access-log"],
+        env=env,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(base + "/products?limit=1", timeout=1)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        print(f"concurrency={args.concurrency} requests={args.requests} threadpool={args.threadpool}")
+        asyncio.run(run(base, args.requests, args.concurrency, pid))
+    finally:
+        server.terminate()
+        server.wait(10)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
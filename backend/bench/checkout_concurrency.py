@@ -0,0 +1,82 @@
+"""Parallel checkout benchmark: many carts race for a product with little stock.
+
+Run from backend/:  python -m bench.checkout_concurrency --buyers 200 --stock 50
+
+Uses a throwaway SQLite database unless DB_PATH or DATABASE_URL is set. Exits non-zero if more units
+were sold than were in stock or stock went negative.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--buyers", type=int, default=200)
+    ap.add_argument("--stock", type=int, default=50)
+    ap.add_argument("--qty", type=int, default=1)
+    ap.add_argument("--threads", type=int, default=32)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench-checkout-")
+    os.environ.setdefault("DB_PATH", os.path.join(tmp, "shop.db"))
+    os.environ.setdefault("LOG_DIR", os.path.join(tmp, "logs"))
+    os.environ.setdefault("UPLOAD_DIR", os.path.join(tmp, "uploads"))
+    os.environ.setdefault("DB_POOL_SIZE", str(args.threads))
+
+    from fastapi import HTTPException
+    from app import main as shop
+
+    shop.init_db()
+    with shop.db_pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO products(sku, name, description, price, image_url, stock) VALUES (?,?,?,?,?,?) RETURNING id",
+            ("BENCH-1", "Bench item", "", 10.0, "", args.stock),
+        )
+        pid = cur.fetchone()[0]
+        cur.executemany(
+            "INSERT INTO carts(cart_id, product_id, qty) VALUES (?,?,?)",
+            [(f"bench-{i}", pid, args.qty) for i in range(args.buyers)],
+        )
+        conn.commit()
+
+    outcomes = {"ok": 0, "conflict": 0, "error": 0}
+    lock = threading.Lock()
+
+    def buy(i: int) -> None:
+        with shop.db_pool.connection() as conn:
+            try:
+                shop._checkout(conn, f"bench-{i}")
+                key = "ok"
+            except HTTPException as e:
+                key = "conflict" if e.status_code == 409 else "error"
+            except Exception:
+                key = "error"
+        with lock:
+            outcomes[key] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as ex:
+        list(ex.map(buy, range(args.buyers)))
+    elapsed = time.perf_counter() - started
+
+    with shop.db_pool.connection() as conn:
+        stock = conn.execute("SELECT stock FROM products WHERE id=?", (pid,)).fetchone()[0]
+        sold = conn.execute("SELECT COALESCE(SUM(qty), 0) FROM order_items WHERE product_id=?", (pid,)).fetchone()[0]
+
+    print(f"buyers={args.buyers} threads={args.threads} stock={args.stock} qty={args.qty}")
+    print(f"ok={outcomes['ok']} conflict={outcomes['conflict']} error={outcomes['error']}")
+    print(f"sold={sold} remaining={stock} elapsed={elapsed:.3f}s checkouts/s={args.buyers / elapsed:.1f}")
+    if sold > args.stock or stock < 0 or sold + stock != args.stock:
+        print("OVERSELL DETECTED")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+"""Login KDF throughput through the hashing process pool.
+
+Run from backend/:  python -m bench.password_hashing --workers 4 --logins 400
+
+Reports verifications per second overall and per worker process (≈ per core).
+Set PBKDF2_ROUNDS to compare cost settings.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from app.hashing import PBKDF2_ROUNDS, PasswordHasher
+
+
+async def run(workers: int, logins: int) -> None:
+    hasher = PasswordHasher(workers=workers, queue_max=logins)
+    try:
+        password_hash = await hasher.hash("bench-password")
+        # warm every worker process before timing
+        await asyncio.gather(*(hasher.verify("bench-password", password_hash) for _ in range(workers)))
+        started = time.perf_counter()
+        results = await asyncio.gather(*(hasher.verify("bench-password", password_hash) for _ in range(logins)))
+        elapsed = time.perf_counter() - started
+    finally:
+        hasher.shutdown()
+    assert all(results)
+    rate = logins / elapsed
+    print(f"rounds={PBKDF2_ROUNDS} workers={workers} logins={logins} elapsed={elapsed:.3f}s")
+    print(f"logins/s={rate:.1f} logins/s/core={rate / workers:.1f}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--logins", type=int, default=200)
+    args = ap.parse_args()
+    asyncio.run(run(args.workers, args.logins))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""Shared fixtures: one app on a throwaway SQLite database for the session.
+
+Run from backend/:  pip install -r requirements-dev.txt && python -m pytest tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix="shop-tests-")
+# app.main reads its settings at import time
+os.environ.update(
+    DB_PATH=os.path.join(_tmp, "shop.db"),
+    LOG_DIR=os.path.join(_tmp, "logs"),
+    UPLOAD_DIR=os.path.join(_tmp, "uploads"),
+    ADMIN_INITIAL_PASSWORD="adminpw1",
+    RATE_LIMIT_BACKEND="memory",
+)
+os.environ.pop("DATABASE_URL", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_tmp, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def shop():
+    from app import main
+    return main
+
+
+@pytest.fixture(scope="session")
+def client(shop):
+    from fastapi.testclient import TestClient
+    with TestClient(shop.app) as c:
+        yield c
+
+
+@pytest.fixture(scope="session")
+def admin(client):
+    r = client.post("/auth/login", data={"username": "admin", "password": "adminpw1"})
+    assert r.status_code == 200, r.text
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+@pytest.fixture
+def product(client, admin):
+    """``make(stock, price=10)`` creates a product and returns its id."""
+    count = iter(range(1, 1_000_000))
+
+    def make(stock: int, price: float = 10.0) -> int:
+        sku = f"T-{os.urandom(4).hex()}-{next(count)}"
+        r = client.post("/admin/products", headers=admin,
+                        data={"sku": sku, "name": sku, "description": "", "price": str(price), "stock": str(stock)})
+        assert r.status_code == 200, r.text
+        return r.json()["id"]
+
+    return make
@@ -0,0 +1,85 @@
+import io
+import json
+import uuid
+
+from app import catalog
+
+
+def _import(client, admin, body: str, name: str):
+    r = client.post("/admin/products/import", headers=admin, files={"file": (name, body.encode())})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def _product(shop, sku):
+    with shop.db_pool.connection() as conn:
+        return conn.execute("SELECT name, price, stock, description FROM products WHERE sku=?", (sku,)).fetchone()
+
+
+def test_csv_import_reports_bad_rows_and_keeps_good_ones(shop, client, admin):
+    p = uuid.uuid4().hex[:6]
+    body = (
+        "sku,name,price,stock\n"
+        f"{p}-1,First,10,5\n"
+        f"{p}-2,Second,abc,5\n"
+        f",Nameless,1,1\n"
+        f"{p}-3,Third,3,-1\n"
+        f"{p}-4,,4,4\n"
+        f"{p}-5,Fifth,5\n"
+        f"{p}-6,Sixth,6,6\n"
+    )
+    report = _import(client, admin, body, "products.csv")
+    assert report["created"] == 2
+    assert report["failed"] == 5
+    assert [e["line"] for e in report["errors"]] == [3, 4, 5, 6, 7]
+    assert "invalid price" in report["errors"][0]["error"]
+    assert report["errors"][1]["error"] == "sku is required"
+    assert report["aborted"] is None
+    assert _product(shop, f"{p}-1")[:3] == ("First", 10.0, 5)
+    assert _product(shop, f"{p}-2") is None
+
+
+def test_import_upserts_by_sku(shop, client, admin):
+    p = uuid.uuid4().hex[:6]
+    _import(client, admin, f"sku,name,price,stock,description\n{p}-1,Old,10,5,keep me\n", "a.csv")
+    lines = [
+        {"sku": f"{p}-1", "price": 12.5},
+        {"sku": f"{p}-2", "name": "New", "price": 1, "stock": 2},
+        {"sku": f"{p}-3", "stock": 1},
+        {"sku": f"{p}-1", "stock": 7},
+    ]
+    report = _import(client, admin, "\n".join(json.dumps(x) for x in lines), "b.jsonl")
+    assert (report["created"], report["updated"], report["failed"]) == (1, 1, 1)
+    assert report["errors"][0]["error"] == "new products need name and price"
+    # fields left out keep their values; the same SKU twice merges field by field
+    assert _product(shop, f"{p}-1") == ("Old", 12.5, 7, "keep me")
+    assert _product(shop, f"{p}-2")[:3] == ("New", 1.0, 2)
+    with shop.db_pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM products WHERE sku=?", (f"{p}-1",)).fetchone()[0] == 1
+
+
+def test_unusable_header_writes_nothing():
+    calls = []
+    stream = io.BytesIO(b"name,price\nx,1\n")
+    try:
+        catalog.import_products(stream, "csv", {}, calls.append)
+    except catalog.ImportFormatError:
+        pass
+    else:
+        raise AssertionError("expected ImportFormatError")
+    assert calls == []
+
+
+def test_write_failure_aborts_after_committed_chunks():
+    body = "".join(json.dumps({"sku": f"s{i}", "name": "n", "price": 1}) + "\n" for i in range(5)).encode()
+    chunks = []
+
+    def write(rows):
+        if chunks:
+            raise RuntimeError("disk full")
+        chunks.append(rows)
+        return {"created": len(rows), "updated": 0, "errors": []}
+
+    report = catalog.import_products(io.BytesIO(body), "jsonl", {}, write, chunk=2)
+    assert report["created"] == 2
+    assert report["aborted"].startswith("write failed after line 4")
@@ -0,0 +1,79 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+
+def _race(shop, carts, user_ids=None):
+    """Check out every cart at once; returns the outcome per cart."""
+    def buy(i):
+        with shop.db_pool.connection() as conn:
+            try:
+                shop._checkout(conn, carts[i], user_ids[i] if user_ids else None)
+                return "ok"
+            except HTTPException as e:
+                return e.status_code
+
+    with ThreadPoolExecutor(max_workers=16) as ex:
+        return list(ex.map(buy, range(len(carts))))
+
+
+def _carts(client, pid, n, qty=1):
+    carts = [f"cart-{uuid.uuid4().hex}" for _ in range(n)]
+    for cart in carts:
+        r = client.post("/cart/items", params={"cart_id": cart, "product_id": pid, "qty": qty})
+        assert r.status_code == 200, r.text
+    return carts
+
+
+def _scalar(shop, sql, *params):
+    with shop.db_pool.connection() as conn:
+        return conn.execute(sql, params).fetchone()[0]
+
+
+def test_parallel_checkouts_never_oversell(shop, client, product):
+    pid = product(stock=10)
+    outcomes = _race(shop, _carts(client, pid, 60))
+    sold = _scalar(shop, "SELECT COALESCE(SUM(qty), 0) FROM order_items WHERE product_id=?", pid)
+    assert outcomes.count("ok") == 10
+    assert set(outcomes) == {"ok", 409}
+    assert sold == 10
+    assert _scalar(shop, "SELECT stock FROM products WHERE id=?", pid) == 0
+
+
+def test_checkout_rejects_more_than_stock(shop, client, product):
+    pid = product(stock=2)
+    cart = _carts(client, pid, 1, qty=3)[0]
+    r = client.post("/orders", params={"cart_id": cart})
+    assert r.status_code == 409
+    assert _scalar(shop, "SELECT stock FROM products WHERE id=?", pid) == 2
+
+
+def test_coupon_use_limit_holds_under_concurrency(shop, client, admin, product):
+    code = f"RACE{uuid.uuid4().hex[:8]}"
+    r = client.post("/admin/coupons", headers=admin, data={"code": code, "type": "fixed", "value": "1", "max_uses": "3"})
+    assert r.status_code == 200, r.text
+    carts = _carts(client, product(stock=100), 20)
+    for cart in carts:
+        assert client.post("/cart/apply-coupon", data={"cart_id": cart, "code": code}).status_code == 200
+    outcomes = _race(shop, carts)
+    assert outcomes.count("ok") == 3
+    assert _scalar(shop, "SELECT uses FROM coupons WHERE code=?", code) == 3
+    assert _scalar(shop, "SELECT COUNT(*) FROM coupon_redemptions r JOIN coupons c ON c.id = r.coupon_id "
+                         "WHERE c.code=?", code) == 3
+
+
+def test_coupon_per_user_limit_holds_under_concurrency(shop, client, admin, product):
+    code = f"ONCE{uuid.uuid4().hex[:8]}"
+    r = client.post("/admin/coupons", headers=admin,
+                    data={"code": code, "type": "fixed", "value": "1", "max_uses_per_user": "1"})
+    assert r.status_code == 200, r.text
+    name = f"buyer{uuid.uuid4().hex[:8]}"
+    assert client.post("/auth/signup", data={"username": name, "password": "secret1"}).status_code == 200
+    uid = _scalar(shop, "SELECT id FROM users WHERE username=?", name)
+    carts = _carts(client, product(stock=100), 8)
+    for cart in carts:
+        assert client.post("/cart/apply-coupon", data={"cart_id": cart, "code": code}).status_code == 200
+    outcomes = _race(shop, carts, [uid] * len(carts))
+    assert outcomes.count("ok") == 1
+    assert _scalar(shop, "SELECT uses FROM coupons WHERE code=?", code) == 1
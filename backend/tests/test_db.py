@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+from app.db import AsyncDatabase
+
+
+@pytest.fixture
+def adb(tmp_path):
+    db = AsyncDatabase(str(tmp_path / "lane.db"))
+    db.run_write(lambda conn: conn.execute("CREATE TABLE t(v INTEGER)"))
+    yield db
+    db.close()
+
+
+def _values(db):
+    return db.run_write(lambda conn: [v for (v,) in conn.execute("SELECT v FROM t ORDER BY v").fetchall()])
+
+
+def test_failed_job_is_rolled_back_to_its_savepoint(adb):
+    def job(conn):
+        conn.execute("INSERT INTO t VALUES (1)")
+        conn.commit()
+        conn.execute("INSERT INTO t VALUES (2)")
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        adb.run_write(job)
+    # work before the job's commit() is kept, work after it is undone
+    assert _values(adb) == [1]
+
+
+def test_job_rollback_keeps_earlier_work(adb):
+    def job(conn):
+        conn.execute("INSERT INTO t VALUES (1)")
+        conn.commit()
+        conn.execute("INSERT INTO t VALUES (2)")
+        conn.rollback()
+        conn.execute("INSERT INTO t VALUES (3)")
+
+    adb.run_write(job)
+    assert _values(adb) == [1, 3]
+
+
+def test_failing_jobs_do_not_undo_their_batch(adb):
+    def job(conn, v):
+        conn.execute("INSERT INTO t VALUES (?)", (v,))
+        if v % 2:
+            raise ValueError(v)
+
+    errors = []
+    start = threading.Barrier(40)
+
+    def submit(v):
+        start.wait()
+        try:
+            adb.run_write(job, v)
+        except ValueError as e:
+            errors.append(e.args[0])
+
+    threads = [threading.Thread(target=submit, args=(v,)) for v in range(40)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(errors) == list(range(1, 40, 2))
+    assert _values(adb) == list(range(0, 40, 2))
+    assert adb.stats()["writer"]["commit_failures"] == 0
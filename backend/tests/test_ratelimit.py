@@ -0,0 +1,72 @@
+import threading
+import uuid
+
+import pytest
+
+from app.ratelimit import LoginRateLimiter, MemoryBackend, SqlBackend
+
+
+@pytest.fixture(params=["memory", "database"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend()
+    return SqlBackend(str(tmp_path / "ratelimit.db"))
+
+
+def test_user_is_locked_out_after_burst(backend):
+    limiter = LoginRateLimiter(backend, user_burst=3, user_window=300, ip_burst=100, ip_window=300)
+    for _ in range(3):
+        assert limiter.check("10.0.0.1", "alice", now=1000)[0]
+        limiter.record_failure("10.0.0.1", "alice")
+    allowed, retry_after = limiter.check("10.0.0.1", "alice", now=1000)
+    assert not allowed
+    assert retry_after == pytest.approx(100)
+    # another user from the same address is not affected
+    assert limiter.check("10.0.0.1", "bob", now=1000)[0]
+    # one token refills after window / burst
+    assert limiter.check("10.0.0.1", "alice", now=1100)[0]
+    assert limiter.counters() == {"failures": 3, "blocked": {"user": 1, "ip": 0}}
+
+
+def test_success_clears_user_but_not_ip(backend):
+    limiter = LoginRateLimiter(backend, user_burst=2, user_window=300, ip_burst=3, ip_window=300)
+    for name in ("alice", "alice"):
+        assert limiter.check("10.0.0.2", name, now=1000)[0]
+        limiter.record_failure("10.0.0.2", name)
+    assert limiter.check("10.0.0.2", "alice", now=1000)[0] is False
+    # the IP has one token left
+    assert limiter.check("10.0.0.2", "carol", now=1000)[0]
+    limiter.record_success("10.0.0.2", "carol", now=1000)
+    assert limiter.check("10.0.0.2", "carol", now=1000)[0]
+    limiter.release("10.0.0.2", "carol", now=1000)
+    # the IP's failures stand after a success from it
+    assert limiter.check("10.0.0.2", "dave", now=1000)[0]
+    assert not limiter.check("10.0.0.2", "erin", now=1000)[0]
+
+
+def test_concurrent_attempts_stay_within_burst(backend):
+    limiter = LoginRateLimiter(backend, user_burst=5, user_window=300, ip_burst=100, ip_window=300)
+    start = threading.Barrier(30)
+    allowed = []
+
+    def attempt():
+        start.wait()
+        allowed.append(limiter.check("10.0.0.3", "mallory", now=1000)[0])
+
+    threads = [threading.Thread(target=attempt) for _ in range(30)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert allowed.count(True) == 5
+
+
+def test_login_endpoint_locks_out(client, shop):
+    name = f"victim{uuid.uuid4().hex[:8]}"
+    assert client.post("/auth/signup", data={"username": name, "password": "secret1"}).status_code == 200
+    burst = int(shop.login_limiter.limits["user"][0])
+    for _ in range(burst):
+        assert client.post("/auth/login", data={"username": name, "password": "wrong"}).status_code == 401
+    r = client.post("/auth/login", data={"username": name, "password": "secret1"})
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) > 0
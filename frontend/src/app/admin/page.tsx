@@ -1,6 +1,7 @@
 ﻿"use client"
 import { useEffect, useState } from 'react'
 import { getApiBase } from "../../lib/getApiBase"
+import { fetchAllPages } from "../../lib/fetchAllPages"
 
 type Product = { id:number; sku:string; name:string; description:string; price:number; image_url:string; stock:number }
 
@@ -51,28 +52,28 @@ export default function AdminPage(){
   }
   async function loadUsers(t:string){
     const url = userQuery ? `${getApiBase()}/admin/users?query=${encodeURIComponent(userQuery)}` : `${getApiBase()}/admin/users`
-    const res = await fetch(url, { headers: { Authorization: `Bearer ${t}` } })
-    if(res.ok) setUsers(await res.json())
+    const items = await fetchAllPages<User>(url, t)
+    if(items) setUsers(items)
   }
   async function loadCategories(t:string){
-    const r = await fetch(`${getApiBase()}/admin/categories`, { headers: { Authorization: `Bearer ${t}` } });
-    if(r.ok) setCategories(await r.json())
+    const items = await fetchAllPages<Category>(`${getApiBase()}/admin/categories`, t);
+    if(items) setCategories(items)
   }
   async function loadMedia(t:string){
-    const r = await fetch(`${getApiBase()}/admin/media`, { headers: { Authorization: `Bearer ${t}` } });
-    if(r.ok) setMedia(await r.json())
+    const items = await fetchAllPages<MediaItem>(`${getApiBase()}/admin/media`, t);
+    if(items) setMedia(items)
   }
   async function loadCoupons(t:string){
-    const r = await fetch(`${getApiBase()}/admin/coupons`, { headers: { Authorization: `Bearer ${t}` } });
-    if(r.ok) setCoupons(await r.json())
+    const items = await fetchAllPages<Coupon>(`${getApiBase()}/admin/coupons`, t);
+    if(items) setCoupons(items)
   }
   async function loadOrders(t:string){
     const params = new URLSearchParams()
     if(orderStatus) params.set('status', orderStatus)
     if(orderMin) params.set('min_total', orderMin)
     if(orderMax) params.set('max_total', orderMax)
-    const r = await fetch(`${getApiBase()}/admin/orders?${params.toString()}`, { headers: { Authorization: `Bearer ${t}` } });
-    if(r.ok) setOrders(await r.json())
+    const items = await fetchAllPages<Order>(`${getApiBase()}/admin/orders?${params.toString()}`, t);
+    if(items) setOrders(items)
   }
   async function loadDashboard(t:string){
     const r = await fetch(`${getApiBase()}/admin/dashboard`, { headers: { Authorization: `Bearer ${t}` } });
@@ -15,7 +15,7 @@ export default function CartPage(){
 
   const apply = async () => {
     if(!code.trim()) return
-    try{ await api.applyCoupon(code.trim()); await refresh() }catch(e:any){ alert(e.message||'쿠폰 적용 실패') }
+    try{ const r = await api.applyCoupon(code.trim()); setState(r.cart) }catch(e:any){ alert(e.message||'쿠폰 적용 실패') }
   }
   const checkout = async () => {
     try{ const r = await api.checkout(); alert(`주문번호: ${r.order_id}`); await refresh() }catch(e:any){ alert(e.message||'결제 실패') }
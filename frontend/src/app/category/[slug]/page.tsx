@@ -3,18 +3,29 @@ import ProductGrid from "../../../components/ProductGrid";
 
 export const dynamic = "force-dynamic";
 
-async function getProducts(slug: string){
-  const res = await fetch(`${getApiBase()}/categories/${slug}/products`, { cache: 'no-store' });
+const LIST_FIELDS = "id,name,description,price,image_url,thumbnail_url";
+
+const PAGE_SIZE = 48;
+
+async function getProducts(slug: string, cursor?: string){
+  const after = cursor ? `&cursor=${encodeURIComponent(cursor)}` : '';
+  const res = await fetch(`${getApiBase()}/categories/${slug}/products?limit=${PAGE_SIZE}&fields=${LIST_FIELDS}${after}`, { cache: 'no-store' });
   if(!res.ok) throw new Error('카테고리 상품을 불러오지 못했습니다');
-  return res.json();
+  return { products: await res.json(), next: res.headers.get('X-Next-Cursor') };
 }
 
-export default async function CategoryPage({ params }: { params: { slug: string }}){
-  const products = await getProducts(params.slug);
+export default async function CategoryPage({ params, searchParams }: { params: { slug: string }, searchParams: { cursor?: string }}){
+  const cursor = searchParams.cursor;
+  const { products, next } = await getProducts(params.slug, cursor);
+  const base = `/category/${params.slug}`;
   return (
     <main>
       <section className="hero"><div className="container"><h1>카테고리: {params.slug}</h1></div></section>
-      <ProductGrid products={products} />
+      <ProductGrid
+        products={products}
+        nextHref={next ? `${base}?cursor=${encodeURIComponent(next)}#products` : undefined}
+        firstHref={cursor ? `${base}#products` : undefined}
+      />
     </main>
   );
 }
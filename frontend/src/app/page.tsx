@@ -4,11 +4,17 @@ import { getApiBase } from "../lib/getApiBase";
 import ProductGrid from "../components/ProductGrid";
 import BestSection from "../components/BestSection";
 
-async function getProducts() {
+// only what the product cards render
+const LIST_FIELDS = "id,name,description,price,image_url,thumbnail_url";
+
+const PAGE_SIZE = 48;
+
+async function getProducts(cursor?: string) {
   const apiBase = getApiBase();
-  const res = await fetch(`${apiBase}/products`, { cache: "no-store" });
+  const after = cursor ? `&cursor=${encodeURIComponent(cursor)}` : "";
+  const res = await fetch(`${apiBase}/products?limit=${PAGE_SIZE}&fields=${LIST_FIELDS}${after}`, { cache: "no-store" });
   if (!res.ok) throw new Error("Failed to fetch products");
-  return res.json();
+  return { products: await res.json(), next: res.headers.get("X-Next-Cursor") };
 }
 
 async function getPublicSettings(){
@@ -38,13 +44,18 @@ function Hero({settings}:{settings:any}){
   );
 }
 
-export default async function Home() {
-  const [products, settings] = await Promise.all([getProducts(), getPublicSettings()]);
+export default async function Home({ searchParams }: { searchParams: { cursor?: string } }) {
+  const cursor = searchParams.cursor;
+  const [{ products, next }, settings] = await Promise.all([getProducts(cursor), getPublicSettings()]);
   return (
     <main>
       <Hero settings={settings} />
-      <BestSection products={products} />
-      <ProductGrid products={products} />
+      {!cursor && <BestSection products={products} />}
+      <ProductGrid
+        products={products}
+        nextHref={next ? `/?cursor=${encodeURIComponent(next)}#products` : undefined}
+        firstHref={cursor ? "/#products" : undefined}
+      />
     </main>
   );
 }
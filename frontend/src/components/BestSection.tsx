@@ -50,7 +50,7 @@ export default function BestSection({ products }: { products: any[] }) {
             <div className="slide" key={p.id}>
               <div className="rank">{i + 1}</div>
               <img
-                src={p.image_url || "/placeholder.svg"}
+                src={p.thumbnail_url || p.image_url || "/placeholder.svg"}
                 alt={p.name}
                 onError={(e) => {
                   (e.currentTarget as HTMLImageElement).src = "/placeholder.svg";
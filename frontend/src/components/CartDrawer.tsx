@@ -62,8 +62,9 @@ export default function CartDrawer({ open, onClose }: { open: boolean; onClose:
             <button
               className="btn"
               onClick={async () => {
-                await api.remove(it.product_id);
-                await refresh();
+                const next = await api.remove(it.product_id);
+                if (next) setState(next);
+                else await refresh();
               }}
               style={{ background: "#ef4444" }}
             >
@@ -7,7 +7,9 @@ function formatMoney(v: number) {
   return new Intl.NumberFormat("ko-KR", { style: "currency", currency: "USD" }).format(v);
 }
 
-export default function ProductGrid({ products }: { products: any[] }) {
+// nextHref/firstHref: links to the following and the first page of a
+// cursor-paged list; omitted when there is none
+export default function ProductGrid({ products, nextHref, firstHref }: { products: any[]; nextHref?: string; firstHref?: string }) {
   const api = useCartApi();
   const [open, setOpen] = React.useState(false);
   const [count, setCount] = React.useState(0);
@@ -30,7 +32,7 @@ export default function ProductGrid({ products }: { products: any[] }) {
           <div className="card" key={p.id}>
             <a href={`/product/${p.id}`}>
               <img
-                src={p.image_url || "/placeholder.svg"}
+                src={p.thumbnail_url || p.image_url || "/placeholder.svg"}
                 alt={p.name}
                 onError={(e) => {
                   (e.currentTarget as HTMLImageElement).src = "/placeholder.svg";
@@ -52,8 +54,9 @@ export default function ProductGrid({ products }: { products: any[] }) {
               <button
                 className="btn"
                 onClick={async () => {
-                  await api.add(p.id, 1);
-                  await refresh();
+                  const next = await api.add(p.id, 1);
+                  if (next) setCount(next.count);
+                  else await refresh();
                 }}
                 style={{ marginTop: 10 }}
               >
@@ -63,6 +66,12 @@ export default function ProductGrid({ products }: { products: any[] }) {
           </div>
         ))}
       </div>
+      {(nextHref || firstHref) && (
+        <div style={{ display: "flex", justifyContent: "center", gap: 8, marginTop: 24 }}>
+          {firstHref && <a className="btn" href={firstHref} style={{ background: "#6b7280" }}>처음으로</a>}
+          {nextHref && <a className="btn" href={nextHref}>다음 상품 보기</a>}
+        </div>
+      )}
       <button className="cart" onClick={() => setOpen(true)}>🛒 장바구니 {count}</button>
       <CartDrawer open={open} onClose={() => setOpen(false)} />
     </div>
@@ -0,0 +1,17 @@
+// Admin listings answer one page at a time and put the next page's cursor in
+// X-Next-Cursor; this follows the cursors so the admin tables get every row.
+// Resolves to null if any page fails, so callers keep what they had.
+export async function fetchAllPages<T>(url: string, token: string, limit = 500): Promise<T[] | null> {
+  const items: T[] = [];
+  let cursor: string | null = null;
+  do {
+    const u = new URL(url, location.origin);
+    u.searchParams.set('limit', String(limit));
+    if (cursor) u.searchParams.set('cursor', cursor);
+    const res = await fetch(u.toString(), { headers: { Authorization: `Bearer ${token}` } });
+    if (!res.ok) return null;
+    items.push(...(await res.json() as T[]));
+    cursor = res.headers.get('X-Next-Cursor');
+  } while (cursor);
+  return items;
+}
@@ -1,5 +1,6 @@
 "use client";
 export type CartState = { cart_id:string; count: number; total: number; discount?: number; final_total?: number; coupon?: string|null; items: Array<{product_id:number;qty:number;name:string;price:number;image_url?:string;line_total:number}> };
+export type CartOp = { product_id: number; qty?: number; op?: "set" | "increment" | "remove" };
 
 import React from "react";
 import { getApiBase } from "./getApiBase";
@@ -21,17 +22,29 @@ export function useCartApi() {
     const res = await fetch(`${apiBase}/cart?cart_id=${cartId}`, { cache: "no-store" });
     return res.json();
   }
-  async function add(product_id: number, qty = 1) {
+  // mutations answer with the updated cart, so callers need no follow-up get()
+  async function add(product_id: number, qty = 1): Promise<CartState | undefined> {
     if (!cartId) return;
     const url = `${apiBase}/cart/items?cart_id=${cartId}&product_id=${product_id}&qty=${qty}`;
-    await fetch(url, { method: "POST" });
+    const res = await fetch(url, { method: "POST" });
+    return res.ok ? res.json() : undefined;
   }
-  async function remove(product_id: number) {
+  async function remove(product_id: number): Promise<CartState | undefined> {
     if (!cartId) return;
     const url = `${apiBase}/cart/items/${product_id}?cart_id=${cartId}`;
-    await fetch(url, { method: "DELETE" });
+    const res = await fetch(url, { method: "DELETE" });
+    return res.ok ? res.json() : undefined;
+  }
+  async function batch(ops: CartOp[]): Promise<{ results: Array<{product_id:number;qty:number;status:string}>; cart: CartState } | undefined> {
+    if (!cartId) return;
+    const res = await fetch(`${apiBase}/cart/items/batch?cart_id=${cartId}`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(ops),
+    });
+    return res.ok ? res.json() : undefined;
   }
-  async function applyCoupon(code: string): Promise<{ok:boolean;discount:number}> {
+  async function applyCoupon(code: string): Promise<{ok:boolean;discount:number;cart:CartState}> {
     if (!cartId) throw new Error("????? ??????");
     const body = new URLSearchParams({ cart_id: cartId, code });
     const res = await fetch(`${apiBase}/cart/apply-coupon`, { method: "POST", body });
@@ -40,9 +53,12 @@ export function useCartApi() {
   }
   async function checkout(): Promise<{ok:boolean;order_id:number;total:number}> {
     const url = `${apiBase}/orders?cart_id=${cartId}`;
-    const res = await fetch(url, { method: "POST" });
+    // signed-in buyers' coupon uses count towards per-user limits
+    const token = localStorage.getItem("token");
+    const headers: Record<string, string> = token ? { Authorization: `Bearer ${token}` } : {};
+    const res = await fetch(url, { method: "POST", headers });
     if (!res.ok) throw new Error("?? ?? ??");
     return res.json();
   }
-  return { cartId, get, add, remove, applyCoupon, checkout };
+  return { cartId, get, add, remove, batch, applyCoupon, checkout };
 }